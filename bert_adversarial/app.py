@@ -20,17 +20,225 @@
 #     Arlington, TX 76019
 #
 
+import aiohttp
+import asyncio
+import codecs
 from urllib import parse
 from sanic import Sanic
-from sanic.response import json
-from requests import request
+from sanic.exceptions import Forbidden, InvalidUsage
+from sanic.response import json, raw, text, stream
 from numpy import argmax
-from nltk import sent_tokenize
+
+from bert_adversarial.core.api.executor import process_intra_op_threads
+from bert_adversarial.core.utils.cpu import configured_cores, pin_cores, set_cpu_env
+from bert_adversarial.core.utils.flags import FLAGS
+
+# Worker processes forked below narrow this down to their own slice of the cores
+if FLAGS.cs_cpu_pin:
+    pin_cores(configured_cores())
+# OpenMP and oneDNN read their environment when TensorFlow is loaded, which the imports below do
+set_cpu_env(process_intra_op_threads(FLAGS.cs_serve_executor, FLAGS.cs_serve_replicas))
 
 from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+from bert_adversarial.core.api.admission import InvalidDeadline, Overloaded
+from bert_adversarial.core.api.encoding import MSGPACK_TYPES, FLOAT32_TYPE, decode_body, dumps_json, \
+    response_format, pack_msgpack, pack_scores
+from bert_adversarial.core.api.fetch_cache import PageCache, fetch_sentences, run_blocking
+from bert_adversarial.core.api.metrics import REGISTRY, timed_stage
+from bert_adversarial.core.api.prefork import serve_prefork
+from bert_adversarial.core.api.registry import ModelRegistry
+from bert_adversarial.core.api.segmentation import get_segmenter
+from bert_adversarial.core.models.model import trace_counts
+from bert_adversarial.core.api.streaming import IncrementalSegmenter, NdjsonParser, StreamScorer, format_event
+from absl import logging
 
-app = Sanic()
+app = Sanic("claimspotter")
 api = ClaimSpotterAPI()
+models = ModelRegistry(api)
+# Loads Punkt before any HTTP worker forks, so no /score/url or /score/stream request pays for it
+get_segmenter()
+cached_models = [x for x in models if x.api.cache is not None]
+replicated_models = [x for x in models if hasattr(x.api, 'replicas')]
+
+REGISTRY.register_callback('claimspotter_batcher_queue_depth', 'Sentences waiting for the micro-batcher',
+                           lambda: {(('model', x.name),): x.batcher.depth() for x in models})
+REGISTRY.register_callback('claimspotter_replicas_idle', 'Model replicas not currently scoring a batch',
+                           lambda: {(('model', x.name),): x.api.replicas.qsize() for x in replicated_models})
+if cached_models:
+    REGISTRY.register_callback('claimspotter_cache_events_total', 'Prediction cache hits, misses and evictions',
+                               lambda: {(('event', k), ('model', x.name)): v
+                                        for x in cached_models for k, v in x.api.cache.counters.items()}, 'counter')
+    REGISTRY.register_callback('claimspotter_cache_entries', 'Predictions held in the in-memory cache tier',
+                               lambda: {(('model', x.name),): len(x.api.cache.memory) for x in cached_models})
+REGISTRY.register_callback('claimspotter_doc_workers', 'Worker processes scoring the shards of large documents',
+                           lambda: {(('model', x.name),): x.api.doc_executor.num_replicas
+                                    if getattr(x.api, 'doc_executor', None) is not None else 0 for x in models})
+REGISTRY.register_callback('claimspotter_admission_total', 'Admission decisions for scoring requests',
+                           lambda: {(('decision', k), ('model', x.name)): v
+                                    for x in models for k, v in x.admission.counters.items()}, 'counter')
+REGISTRY.register_callback('claimspotter_admitted_sentences', 'Sentences admitted and not yet scored',
+                           lambda: {(('model', x.name),): x.admission.outstanding for x in models})
+REGISTRY.register_callback('claimspotter_single_flight_sentences_total',
+                           'Unique sentences scored, joined to an identical in-flight query, or repeated in a request',
+                           lambda: {(('model', x.name), ('outcome', k)): v for x in models
+                                    if hasattr(x.api, 'single_flight') for k, v in x.api.single_flight.counters.items()},
+                           'counter')
+if FLAGS.cs_serve_page_cache_db:
+    REGISTRY.register_callback('claimspotter_page_cache_total', 'Fetched pages by revalidation outcome, and score hits',
+                               lambda: {(('event', k),): v for k, v in app.page_cache.counters.items()}
+                               if getattr(app, 'page_cache', None) is not None else {}, 'counter')
+REGISTRY.register_callback('claimspotter_model_traces_total', 'Traces of the inference function by padded length; '
+                           'more than one per length and replica means a request paid for a retrace',
+                           lambda: {(('seq_len', k),): v for k, v in trace_counts.items()}, 'counter')
+if api.cascade is not None:
+    REGISTRY.register_callback('claimspotter_cascade_sentences_total', 'Sentences decided by the SVM or the transformer',
+                               lambda: {(('route', k),): v for k, v in api.cascade.counters.items()}, 'counter')
+
+
+def timed_request(endpoint, model):
+    return REGISTRY.timed('claimspotter_request_seconds', 'End-to-end request latency', endpoint=endpoint,
+                          model=model.name)
+
+
+def get_model(request, from_body=True):
+    """
+    Returns the served model named by the `model` query parameter or JSON body field, or the default model.
+    """
+    name = request.args.get("model")
+    if name is None and from_body and request.method == "POST":
+        try:
+            name = request_body(request).get("model")
+        except Exception:
+            pass
+
+    try:
+        return models.get(name)
+    except KeyError:
+        raise InvalidUsage("Unknown model `{}`, expected one of {}".format(name, list(models.models)))
+
+
+@app.listener("before_server_start")
+async def start_batcher(app, loop):
+    models.start()
+
+
+@app.listener("before_server_start")
+async def start_http_session(app, loop):
+    app.http_session = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=FLAGS.cs_serve_http_pool_size),
+        timeout=aiohttp.ClientTimeout(total=FLAGS.cs_serve_http_timeout))
+
+
+@app.listener("before_server_start")
+async def start_page_cache(app, loop):
+    # Opened per HTTP worker, since sqlite connections must not be shared across fork()
+    app.page_cache = None
+    if FLAGS.cs_serve_page_cache_db:
+        app.page_cache = PageCache(FLAGS.cs_serve_page_cache_db, FLAGS.cs_serve_page_cache_size)
+
+
+@app.listener("before_server_start")
+async def start_model_watch(app, loop):
+    app.model_watch = None
+    if FLAGS.cs_serve_watch_interval > 0:
+        app.model_watch = asyncio.ensure_future(watch_model_dir())
+
+
+@app.listener("after_server_stop")
+async def stop_model_watch(app, loop):
+    if app.model_watch is not None:
+        app.model_watch.cancel()
+
+
+async def watch_model_dir():
+    """
+    Hot-swaps in the newest model under cs_model_dir (or the cs_serve_saved_model directory) whenever it changes. A
+    change has to be seen on two consecutive checks before it is loaded, so checkpoints still being written are skipped.
+    """
+    loop = asyncio.get_event_loop()
+    candidate, failed = None, None
+
+    while True:
+        await asyncio.sleep(FLAGS.cs_serve_watch_interval)
+        try:
+            identity = api._model_identity()
+        except Exception:
+            continue
+
+        if identity in (api.model_identity, failed):
+            candidate = None
+            continue
+        if identity != candidate:
+            candidate = identity
+            continue
+
+        try:
+            await loop.run_in_executor(None, api.hot_swap)
+        except Exception as e:
+            logging.error('Hot-swap to {} failed: {}'.format(identity, e))
+            failed = identity
+        candidate = None
+
+
+@app.listener("after_server_stop")
+async def stop_batcher(app, loop):
+    await models.stop()
+
+
+@app.listener("after_server_stop")
+async def stop_http_session(app, loop):
+    await app.http_session.close()
+
+
+@app.exception(Overloaded)
+async def overloaded(request, exception):
+    return json({'error': exception.reason}, status=exception.status,
+                headers={'Retry-After': str(exception.retry_after)})
+
+
+@app.exception(InvalidDeadline)
+async def invalid_deadline(request, exception):
+    return json({'error': str(exception)}, status=400)
+
+
+def with_degraded_header(response, degraded):
+    if degraded:
+        response.headers['X-ClaimSpotter-Degraded'] = degraded
+    return response
+
+
+def request_body(request):
+    """
+    Returns the POST body decoded from msgpack (when sent as `application/msgpack`) or JSON, or an empty dict.
+    """
+    if not hasattr(request.ctx, "body"):
+        request.ctx.body = decode_body(request.headers.get("content-type"), request.body) or {}
+    return request.ctx.body
+
+
+def scores_response(request, obj, scores, degraded=None):
+    """
+    Encodes a scoring response as JSON, or as msgpack or packed float32 scores if the client accepts them.
+    """
+    fmt = response_format(request.headers.get("accept"))
+    if fmt == "float32":
+        response = raw(pack_scores(scores), content_type=FLOAT32_TYPE, headers={"X-ClaimSpotter-Rows": str(len(scores))})
+    elif fmt == "msgpack":
+        response = raw(pack_msgpack(obj), content_type=MSGPACK_TYPES[0])
+    else:
+        response = json(obj, dumps=dumps_json)
+    return with_degraded_header(response, degraded)
+
+
+def format_results(model, sentences, all_scores):
+    return [{'claim': sentence, 'result': model.api.return_strings[argmax(scores)], 'scores': [scores]}
+            for sentence, scores in zip(sentences, all_scores)]
+
+
+def score_single_sentence(model):
+    async def score(sentences):
+        return [await model.batcher.submit(sentences[0])]
+    return score
 
 
 def get_user_input(r, input_text, k="input_text"):
@@ -38,16 +246,18 @@ def get_user_input(r, input_text, k="input_text"):
         if r.method == "GET":
             return parse.unquote_plus(input_text.strip())
         elif r.method == "POST":
-            return r.json.get(k, "")
+            return request_body(r).get(k, "")
     except Exception as e:
         print(e)
 
     return ""
 
 
-def get_url_score(url, tokenize_sentence=False):
+async def get_url_score(url, tokenize_sentence=False, timeout=None, model=None):
     """
-    Returns the scores of each sentence at the provided URL.
+    Returns the scores of each content sentence at the provided URL. Markup, scripts and boilerplate such as menus
+    and footers are stripped before scoring. With --cs_serve_page_cache_db, pages whose content has not changed since
+    they were last scored by the same model are served from the cache without any model work.
 
     Parameters
     ----------
@@ -55,6 +265,10 @@ def get_url_score(url, tokenize_sentence=False):
         Path to web page to score.
     tokenize_sentence : boolean
         Return a list of scored sentences instead of a single line.
+    timeout : float
+        Seconds the whole request may take, including the download. None waits indefinitely.
+    model : ServedModel
+        Model to score with. Defaults to the default model.
     
     Returns
     -------
@@ -65,24 +279,27 @@ def get_url_score(url, tokenize_sentence=False):
         `claim` : string
         `result` : string
         `scores` : list[float]
+    string
+        The degraded mode the scores were served in when overloaded, otherwise None.
     """
-    
-    url_text = request('GET', url).text
-    url_text = url_text.replace("\r", "")
+    start = asyncio.get_event_loop().time()
+    content_key, sentences = await fetch_sentences(app.http_session, url, app.page_cache, tokenize_sentence)
 
-    if tokenize_sentence:
-        sentences = sent_tokenize(url_text)
-    else:
-        sentences = [url_text]
-    
-    results = []
+    sentences = [x for x in sentences if x]
+    model = model or models.get()
+    model_id = model.api.model_identity
+    all_scores, degraded = None, None
+    if app.page_cache is not None:
+        all_scores = await run_blocking(app.page_cache.scores, content_key, model_id)
 
-    for sentence in sentences:
-        if sentence:
-            scores = api.single_sentence_query(results)
-            results.append({'claim': sentence, 'result': api.return_strings[argmax(scores)], 'scores': scores})
+    if all_scores is None:
+        if timeout is not None:
+            timeout = max(0.001, timeout - (asyncio.get_event_loop().time() - start))
+        all_scores, degraded = await model.admission.run(sentences, timeout, model.api.async_document_query)
+        if app.page_cache is not None and degraded is None:
+            await run_blocking(app.page_cache.store_scores, content_key, model_id, all_scores)
 
-    return results
+    return format_results(model, sentences, all_scores), degraded
 
 
 @app.route("/score/text/<input_text:(?!custom/).*>", methods=["POST", "GET"])
@@ -94,6 +311,8 @@ async def score_text(request, input_text):
     ----------
     input_text : string
         Input text to be scored.
+    model : string
+        Query parameter or JSON body field naming the model to score with. Defaults to the default model.
     
     Returns
     -------
@@ -104,10 +323,17 @@ async def score_text(request, input_text):
         `result` : string
         `scores` : list[float]
     """
-    input_text = get_user_input(request, input_text)
-    scores = api.single_sentence_query(input_text) if input_text else []
+    model = get_model(request)
+    with timed_request('text', model):
+        input_text = get_user_input(request, input_text)
+        scores, degraded = [], None
+        if input_text:
+            scores, degraded = await model.admission.run([input_text], model.admission.timeout_for(request.headers),
+                                                         score_single_sentence(model))
 
-    return json({'claim': input_text, 'result': api.return_strings[argmax(scores)], 'scores': scores})
+    return scores_response(
+        request, {'claim': input_text, 'result': model.api.return_strings[argmax(scores)], 'scores': scores}, scores,
+        degraded)
 
 
 @app.route("/score/url/<url:path>", methods=["POST", "GET"])
@@ -119,6 +345,8 @@ async def score_url(request, url):
     ----------
     url : string
         Web page to be scored.
+    model : string
+        Query parameter or JSON body field naming the model to score with. Defaults to the default model.
     
     Returns
     -------
@@ -130,10 +358,225 @@ async def score_url(request, url):
         `result` : string
         `scores` : list[float]
     """
-    url = get_user_input(request, url, "url")
-    results = get_url_score(url, True)
+    model = get_model(request)
+    with timed_request('url', model):
+        url = get_user_input(request, url, "url")
+        results, degraded = await get_url_score(url, True, model.admission.timeout_for(request.headers), model)
+
+    return scores_response(request, results, [x['scores'][0] for x in results], degraded)
+
+
+@app.route("/score/batch", methods=["POST"])
+async def score_batch(request):
+    """
+    Returns the scores of a batch of sentences. The body is JSON, or msgpack when sent as `application/msgpack`.
+
+    Parameters
+    ----------
+    sentences : list[string]
+        Sentences to be scored.
+    model : string
+        Query parameter or body field naming the model to score with. Defaults to the default model.
+
+    Returns
+    -------
+    <Response>
+        Returns a response object with the body containing a list of dictionaries containing the `claim`, it's
+        `result`, and the `scores` associated with each sentence, in order. The body is JSON by default, msgpack if the
+        client accepts `application/msgpack`, or only the scores as rows of two little-endian float32s if it accepts
+        `application/x-claimspotter-float32`.
+
+        `claim` : string
+        `result` : string
+        `scores` : list[float]
+    """
+    model = get_model(request)
+    with timed_request('batch', model):
+        try:
+            sentences = request_body(request).get("sentences", [])
+        except Exception:
+            raise InvalidUsage("Expected a JSON or msgpack body with a `sentences` list")
+        if not isinstance(sentences, list) or not all(isinstance(x, str) for x in sentences):
+            raise InvalidUsage("`sentences` must be a list of strings")
+
+        all_scores, degraded = [], None
+        if sentences:
+            all_scores, degraded = await model.admission.run(sentences, model.admission.timeout_for(request.headers),
+                                                             model.api.async_document_query)
+
+    return scores_response(request, format_results(model, sentences, all_scores), all_scores, degraded)
+
+
+@app.route("/score/ids", methods=["POST"])
+async def score_ids(request):
+    """
+    Returns the scores of pre-tokenized sentences, skipping text normalization, sentiment analysis and tokenization.
+    The body is JSON, or msgpack when sent as `application/msgpack`. Only transformer models accept token ids.
+
+    Parameters
+    ----------
+    input_ids : list[list[int]]
+        Token ids of each sentence as the model's tokenizer produces them, including [CLS] and [SEP] for BERT. Each
+        list holds at most `cs_max_len` ids, all smaller than the vocabulary size.
+    sentiments : list[list[float]], optional
+        The [polarity, subjectivity] of each sentence, as computed by TextBlob. Defaults to [0.0, 0.0].
+    model : string
+        Query parameter or body field naming the model to score with. Defaults to the default model.
+
+    Returns
+    -------
+    <Response>
+        Returns a response object with the body containing a list of dictionaries containing the `result` and the
+        `scores` associated with each sentence, in order, encoded like the response of `/score/batch`.
+
+        `result` : string
+        `scores` : list[float]
+    """
+    model = get_model(request)
+    if not hasattr(model.api, "async_ids_query"):
+        raise InvalidUsage("Only transformer models accept token ids")
+
+    with timed_request('ids', model):
+        try:
+            body = request_body(request)
+            items = model.api.check_token_ids(body.get("input_ids", []), body.get("sentiments"))
+        except ValueError as e:
+            raise InvalidUsage(str(e))
+        except Exception:
+            raise InvalidUsage("Expected a JSON or msgpack body with an `input_ids` list")
+
+        all_scores = []
+        if items:
+            all_scores, _ = await model.admission.run(items, model.admission.timeout_for(request.headers),
+                                                      model.api.async_ids_query, cost=len(items),
+                                                      allow_degraded=False)
+
+    return scores_response(request, [{'result': model.api.return_strings[argmax(scores)], 'scores': [scores]}
+                                     for scores in all_scores], all_scores)
+
+
+@app.route("/score/stream", methods=["POST"], stream=True)
+async def score_stream(request):
+    """
+    Scores a document of any size as it is uploaded, and streams back each sentence's result as soon as it is scored.
+
+    Parameters
+    ----------
+    request body : chunked text, or NDJSON if the Content-Type contains `ndjson`
+        NDJSON lines are JSON strings or objects with a `text` field, and are joined with spaces. Invalid lines, and
+        lines longer than cs_serve_stream_max_buffer bytes, are skipped with an `error` event giving their `line`.
+    format : string
+        `ndjson` (default) or `sse`. Server-Sent Events are also used if the client accepts `text/event-stream`.
+    model : string
+        Query parameter naming the model to score with. Defaults to the default model.
+
+    Returns
+    -------
+    <StreamingHTTPResponse>
+        One event per sentence, in document order, containing its `index`, the `claim`, it's `result`, and the
+        `scores` associated with it.
+    """
+    sse = request.args.get("format") == "sse" or "text/event-stream" in request.headers.get("accept", "")
+    ndjson = "ndjson" in request.headers.get("content-type", "")
+    model = get_model(request, from_body=False)
 
-    return json(results)
+    async def stream_results(response):
+        segmenter = IncrementalSegmenter()
+        scorer = StreamScorer(model.api, lambda obj: response.write(format_event(obj, sse)))
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        parser = NdjsonParser()
+
+        async def read_text(chunk):
+            if not ndjson:
+                return decoder.decode(chunk) if chunk is not None else decoder.decode(b"", final=True)
+            text, errors = parser.feed(chunk) if chunk is not None else parser.close()
+            for error in errors:
+                await response.write(format_event(error, sse))
+            return text
+
+        try:
+            with timed_request('stream', model):
+                while True:
+                    chunk = await request.stream.read()
+                    if chunk is None:
+                        break
+                    chunk_text = await read_text(chunk)
+                    with timed_stage('segment'):
+                        sentences = segmenter.feed(chunk_text)
+                    await scorer.add(sentences)
+
+                chunk_text = await read_text(None)
+                await scorer.add(segmenter.feed(chunk_text) + segmenter.close())
+                await scorer.finish()
+        finally:
+            scorer.cancel()
+
+    return stream(stream_results, content_type="text/event-stream" if sse else "application/x-ndjson")
+
+
+def check_admin(request):
+    if not FLAGS.cs_serve_admin_token or request.headers.get("x-admin-token") != FLAGS.cs_serve_admin_token:
+        raise Forbidden("Admin endpoints are disabled or the X-Admin-Token is wrong")
+
+
+@app.route("/admin/model", methods=["GET"])
+async def admin_model(request):
+    """
+    Returns the identity of the default model, and the kind and identity of every model being served.
+    """
+    check_admin(request)
+    return json({'model': api.model_identity, 'models': models.describe()})
+
+
+@app.route("/admin/swap", methods=["POST"])
+async def admin_swap(request):
+    """
+    Loads, warms and validates a new model in the background, then switches traffic to it without downtime.
+
+    Parameters
+    ----------
+    model_dir : string
+        JSON body field. Checkpoint folder, or SavedModel directory when serving with --cs_serve_saved_model.
+        Defaults to the newest model in the configured location.
+    model : string
+        JSON body field naming the transformer model to replace. Defaults to the default model.
+
+    Returns
+    -------
+    <Response>
+        The identity of the model now being served, or the reason the swap was refused.
+    """
+    check_admin(request)
+    model = get_model(request)
+    if not hasattr(model.api, 'hot_swap'):
+        raise InvalidUsage("Only transformer models can be hot-swapped")
+
+    model_dir = (request.json or {}).get("model_dir")
+    try:
+        identity = await asyncio.get_event_loop().run_in_executor(None, model.api.hot_swap, model_dir)
+    except Exception as e:
+        logging.error('Hot-swap to {} failed: {}'.format(model_dir, e))
+        return json({'error': str(e), 'model': model.api.model_identity}, status=409)
+    return json({'model': identity})
+
+
+@app.route("/models", methods=["GET"])
+async def list_models(request):
+    """
+    Returns the names of the models that requests can pick with `model=`, and their kinds.
+    """
+    return json({model.name: model.kind for model in models})
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics(request):
+    """
+    Returns per-stage latencies, batch sizes, queue depth and cache stats of this worker in Prometheus text format.
+    """
+    return text(REGISTRY.render(), content_type='text/plain; version=0.0.4')
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=8000)
+    if api.executor_type == "prefork":
+        serve_prefork(app, api, "0.0.0.0", 8000, FLAGS.cs_serve_http_workers)
+    else:
+        app.run(host="0.0.0.0", port=8000)
@@ -0,0 +1,137 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import asyncio
+import json
+import subprocess
+import sys
+import time
+from bert_adversarial.core.utils.cpu import configured_cores, set_cpu_env
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+
+TUNED_FLAGS = ['cs_serve_executor', 'cs_serve_replicas', 'cs_serve_intra_op_threads', 'cs_inter_op_threads',
+               'cs_cpu_pin', 'cs_cpu_onednn']
+
+TEMPLATES = ['The unemployment rate fell to {} percent last year, the lowest level in a decade.',
+             'We spent {} billion dollars on roads and bridges while taxes went up.',
+             'I want to thank everyone in this room for {} years of support.',
+             'Senator Smith voted against the bill {} times, and he says he is proud of it.',
+             'Crime went down {} percent in cities that hired more police officers.',
+             'Thank you.']
+
+
+def workload(num_sentences):
+    # Distinct sentences, so neither the per-batch dedupe nor single-flight skips any of them
+    return ['{} ({})'.format(TEMPLATES[i % len(TEMPLATES)].format(i), i) for i in range(num_sentences)]
+
+
+def run_trial():
+    from bert_adversarial.core.api.executor import process_intra_op_threads
+
+    # Set before the import below loads TensorFlow, which reads it then
+    set_cpu_env(process_intra_op_threads(FLAGS.cs_serve_executor, FLAGS.cs_serve_replicas))
+    from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+
+    api = ClaimSpotterAPI(use_cache=False, use_cascade=False, doc_workers=0)
+    sentences = workload(FLAGS.cs_autotune_sentences)
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(api.async_document_query(workload(FLAGS.cs_batch_size_reg * api.num_replicas)))
+
+    start = time.perf_counter()
+    loop.run_until_complete(api.async_document_query(sentences))
+    print(json.dumps({'sentences_per_sec': len(sentences) / (time.perf_counter() - start)}))
+
+
+def measure(config):
+    """
+    Runs one trial in a fresh interpreter, since TF thread pools cannot be resized once its runtime has started.
+    Returns sentences scored per second, or 0 if the configuration failed.
+    """
+    args = [x for x in sys.argv[1:] if x.lstrip('-').split('=')[0] not in TUNED_FLAGS + ['cs_cpu_profile']]
+    args += ['--{}={}'.format(k, v) for k, v in config.items()] + ['--cs_autotune_trial']
+    proc = subprocess.run([sys.executable, '-m', 'bert_adversarial.autotune'] + args, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, universal_newlines=True)
+    lines = [x for x in proc.stdout.splitlines() if x.startswith('{')]
+    if proc.returncode != 0 or not lines:
+        logging.warning('Configuration {} failed:\n{}'.format(config, proc.stderr[-2000:]))
+        return 0.0
+    return json.loads(lines[-1])['sentences_per_sec']
+
+
+def candidate_configs(num_cores):
+    replicas = [1]
+    while replicas[-1] * 2 <= num_cores:
+        replicas.append(replicas[-1] * 2)
+
+    for num_replicas in replicas:
+        for inter_op_threads in [1, 2]:
+            for executor in ['thread'] + (['process'] if num_replicas > 1 else []):
+                yield {'cs_serve_executor': executor, 'cs_serve_replicas': num_replicas,
+                       # One TF runtime per process: thread replicas share its pool, process workers split the cores
+                       'cs_serve_intra_op_threads': (num_cores if executor == 'thread' else
+                                                     max(1, num_cores // num_replicas)),
+                       'cs_inter_op_threads': inter_op_threads, 'cs_cpu_pin': executor == 'process',
+                       'cs_cpu_onednn': 'default'}
+
+
+def main():
+    cores = configured_cores()
+    logging.info('Tuning for {} cores: {}'.format(len(cores), cores))
+
+    trials = []
+    for config in candidate_configs(len(cores)):
+        trials.append((config, measure(config)))
+        logging.info('{} -> {:.1f} sentences/s'.format(config, trials[-1][1]))
+
+    # oneDNN only changes which kernels run, so it is tried on the best thread layout rather than on every one
+    best = max(trials, key=lambda x: x[1])[0]
+    for onednn in ['on', 'off']:
+        config = dict(best, cs_cpu_onednn=onednn)
+        trials.append((config, measure(config)))
+        logging.info('{} -> {:.1f} sentences/s'.format(config, trials[-1][1]))
+
+    print('{:<9} {:>9} {:>7} {:>7} {:>5} {:>8} {:>12}'.format('Executor', 'Replicas', 'Intra', 'Inter', 'Pin',
+                                                              'oneDNN', 'Sentences/s'))
+    for config, throughput in trials:
+        print('{:<9} {:>9} {:>7} {:>7} {:>5} {:>8} {:>12.1f}'.format(
+            config['cs_serve_executor'], config['cs_serve_replicas'], config['cs_serve_intra_op_threads'],
+            config['cs_inter_op_threads'], str(config['cs_cpu_pin']), config['cs_cpu_onednn'], throughput))
+
+    best, throughput = max(trials, key=lambda x: x[1])
+    if throughput <= 0:
+        raise Exception('Every configuration failed, see the warnings above')
+    if FLAGS.cs_cpu_cores:
+        best['cs_cpu_cores'] = FLAGS.cs_cpu_cores
+
+    with open(FLAGS.cs_autotune_out, 'w') as f:
+        json.dump({'flags': best, 'sentences_per_sec': throughput, 'cores': cores}, f, indent=2)
+    print('Wrote {} ({:.1f} sentences/s). Serve with --cs_cpu_profile={}'.format(FLAGS.cs_autotune_out, throughput,
+                                                                             FLAGS.cs_autotune_out))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    if FLAGS.cs_autotune_trial:
+        run_trial()
+    else:
+        main()
@@ -0,0 +1,73 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import time
+import numpy as np
+from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+from bert_adversarial.core.utils.data_loader import DataLoader
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+
+
+def score(api, sentences, length_buckets):
+    api.length_buckets = length_buckets
+    api.query_uncached(sentences)
+
+    start = time.perf_counter()
+    ret = np.array(api.query_uncached(sentences))
+    return ret, len(sentences) / (time.perf_counter() - start)
+
+
+def main():
+    """
+    Scores the dev set padded to cs_max_len and again with cs_serve_length_buckets. The transformer attends to pad
+    tokens, so the bucketed scores drift from the fixed-length ones; this reports by how much, per padded length.
+    """
+    api = ClaimSpotterAPI(num_replicas=1, executor_type='thread', use_cache=False, use_cascade=False, doc_workers=0)
+    length_buckets = api.length_buckets
+    if len(length_buckets) < 2:
+        raise Exception('Pass the buckets to check with --cs_serve_length_buckets')
+
+    sentences = [x[0] for x in DataLoader.parse_json(FLAGS.cs_raw_dj_eval_loc)]
+    features = api._create_bert_features(api._extract_info(sentences)[0])
+    padded_len = np.array([api._bucket_length(len(x)) for x in features])
+
+    reference, reference_rate = score(api, sentences, [api.max_len])
+    bucketed, bucketed_rate = score(api, sentences, length_buckets)
+    drift = np.abs(bucketed - reference)[:, 1]
+    flips = np.argmax(bucketed, axis=1) != np.argmax(reference, axis=1)
+
+    print('{:<8} {:>10} {:>12} {:>12} {:>12}'.format('Pad len', 'Sentences', 'Max drift', 'Mean drift', 'Label flips'))
+    for seq_len in length_buckets:
+        sel = padded_len == seq_len
+        if sel.any():
+            print('{:<8} {:>10} {:>12.2e} {:>12.2e} {:>12}'.format(seq_len, int(sel.sum()), drift[sel].max(),
+                                                                   drift[sel].mean(), int(flips[sel].sum())))
+    print('{:<8} {:>10} {:>12.2e} {:>12.2e} {:>12}'.format('All', len(sentences), drift.max(), drift.mean(),
+                                                           int(flips.sum())))
+    print('Sentences/s: {:.1f} padded to {}, {:.1f} bucketed ({:.2f}x)'.format(
+        reference_rate, api.max_len, bucketed_rate, bucketed_rate / reference_rate))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
@@ -0,0 +1,87 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import json
+import platform
+import time
+import numpy as np
+from bert_adversarial.core.api.encoding import dumps_json, pack_msgpack, pack_scores
+from absl import logging
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+NUM_SENTENCES = 3000
+REPEATS = 50
+
+RETURN_STRINGS = ['Non-factual sentence', 'Check-worthy factual statement']
+
+
+def response(num_sentences):
+    # Same shape as the /score/batch response, with probabilities drawn at random
+    rng = np.random.RandomState(0)
+    ret = []
+    for i in range(num_sentences):
+        p = float(rng.rand())
+        ret.append({'claim': 'Sentence number {} of the document, about as long as a typical one.'.format(i),
+                    'result': RETURN_STRINGS[int(p > 0.5)], 'scores': [[1.0 - p, p]]})
+    return ret
+
+
+def encode_time(fn, obj):
+    body = fn(obj)
+    times = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        fn(obj)
+        times.append(time.perf_counter() - start)
+    return len(body), float(np.median(times))
+
+
+def main():
+    body = response(NUM_SENTENCES)
+    scores = [x['scores'][0] for x in body]
+
+    encoders = [('json (stdlib)', body, lambda x: json.dumps(x, separators=(',', ':')))]
+    if ujson is not None:
+        encoders.append(('ujson', body, ujson.dumps))
+    encoders.append(('dumps_json', body, dumps_json))
+    encoders.append(('msgpack', body, pack_msgpack))
+    encoders.append(('float32', scores, pack_scores))
+
+    print('{} sentences on {} ({}), Python {}'.format(NUM_SENTENCES, platform.processor() or platform.machine(),
+                                                       platform.platform(), platform.python_version()))
+    print('{:<16} {:>10} {:>12}'.format('Encoding', 'KB', 'Median (ms)'))
+    for name, obj, fn in encoders:
+        try:
+            size, elapsed = encode_time(fn, obj)
+        except (AttributeError, TypeError) as e:
+            logging.warning('Skipping {}: {}'.format(name, e))
+            continue
+        print('{:<16} {:>10.1f} {:>12.2f}'.format(name, size / 1024, elapsed * 1e3))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
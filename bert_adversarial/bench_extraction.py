@@ -0,0 +1,94 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import asyncio
+import glob
+import io
+import os
+import time
+from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+from bert_adversarial.core.api.extraction import read_page
+from bert_adversarial.core.utils import transformations as transf
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+
+
+def raw_sentences(page):
+    # What /score/url did before content extraction: segment the whole decoded body, markup included
+    return [x for x in transf.sentence_tokenize(page.decode('utf-8', errors='replace').replace('\r', '')) if x]
+
+
+def extracted_sentences(page):
+    body = io.BytesIO(page)
+
+    async def read(n):
+        return body.read(n)
+
+    return asyncio.get_event_loop().run_until_complete(read_page(read, 'text/html'))
+
+
+def timed_run(api, pages, extract_fn):
+    sentences, extract_time, score_time = 0, 0.0, 0.0
+    for page in pages:
+        start = time.perf_counter()
+        page_sentences = extract_fn(page)
+        extract_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        if page_sentences:
+            api.batch_sentence_query(page_sentences)
+        score_time += time.perf_counter() - start
+        sentences += len(page_sentences)
+    return sentences, extract_time, score_time
+
+
+def main():
+    page_locs = sorted(glob.glob(os.path.join(FLAGS.cs_bench_pages_dir, '*.htm*')))
+    if not page_locs:
+        raise Exception('No .html pages found in {}'.format(FLAGS.cs_bench_pages_dir))
+
+    pages = []
+    for loc in page_locs:
+        with open(loc, 'rb') as f:
+            pages.append(f.read())
+    logging.info('Loaded {} pages ({:.1f} MB)'.format(len(pages), sum(len(x) for x in pages) / 2 ** 20))
+
+    api = ClaimSpotterAPI(use_cache=False, use_cascade=False)
+    # One untimed query so tracing and allocation do not count against either pipeline
+    api.batch_sentence_query(extracted_sentences(pages[0])[:FLAGS.cs_batch_size_reg])
+
+    stats = {'raw': timed_run(api, pages, raw_sentences), 'extracted': timed_run(api, pages, extracted_sentences)}
+
+    print('{:<10} {:>10} {:>12} {:>12} {:>12}'.format('Pipeline', 'Sentences', 'Extract (s)', 'Score (s)',
+                                                       'Total (s)'))
+    for name, (sentences, extract_time, score_time) in stats.items():
+        print('{:<10} {:>10} {:>12.3f} {:>12.3f} {:>12.3f}'.format(name, sentences, extract_time, score_time,
+                                                                   extract_time + score_time))
+    raw, extracted = stats['raw'], stats['extracted']
+    print('Sentences scored: -{:.1f}% | End-to-end speedup: {:.2f}x'.format(
+        100 * (1 - extracted[0] / raw[0]), (raw[1] + raw[2]) / (extracted[1] + extracted[2])))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
@@ -0,0 +1,89 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import multiprocessing
+import os
+import time
+import numpy as np
+from bert_adversarial.core.api.prefork import ModelHost, RemotePredictor, SharedBatchSlot, slot_capacity
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+
+ROUND_TRIPS = 2000
+
+
+class EchoAPI:
+    # Answers every batch with constant probabilities, so only the transport is timed
+    max_len = FLAGS.cs_max_len
+
+    @staticmethod
+    def preds_on_batch(x):
+        return np.full((len(x[0]), FLAGS.cs_num_classes), 1.0 / FLAGS.cs_num_classes, dtype=np.float32)
+
+
+class EchoHost(ModelHost):
+    def __init__(self):
+        self.api = EchoAPI()
+
+
+def round_trip_time(predictor, seq_len):
+    x = (np.random.randint(0, 30000, size=(FLAGS.cs_batch_size_reg, seq_len)).astype(np.int32),
+         np.random.rand(FLAGS.cs_batch_size_reg, 2).astype(np.float32))
+    for _ in range(ROUND_TRIPS // 10):
+        np.asarray(predictor.preds_on_batch(x)).tolist()
+
+    start = time.perf_counter()
+    for _ in range(ROUND_TRIPS):
+        np.asarray(predictor.preds_on_batch(x)).tolist()
+    return (time.perf_counter() - start) / ROUND_TRIPS
+
+
+def main():
+    seq_lens = sorted(set([int(x) for x in FLAGS.cs_serve_length_buckets if int(x) < FLAGS.cs_max_len] +
+                          [FLAGS.cs_max_len]))
+    transports = ['pipe', 'shm']
+
+    links = [multiprocessing.Pipe() for _ in transports]
+    slots = [None, SharedBatchSlot(slot_capacity(EchoAPI))]
+    EchoHost().serve([parent_conn for parent_conn, _ in links], slots)
+
+    # Like the prefork HTTP workers, the client is a forked process that talks to the host over its link
+    results_conn, child_results_conn = multiprocessing.Pipe()
+    pid = os.fork()
+    if pid == 0:
+        predictors = [RemotePredictor(child_conn, slot) for (_, child_conn), slot in zip(links, slots)]
+        child_results_conn.send([[round_trip_time(p, seq_len) for p in predictors] for seq_len in seq_lens])
+        os._exit(0)
+    results = results_conn.recv()
+    os.waitpid(pid, 0)
+
+    print('{:<8} {:>8} {:>10} {:>12} {:>12} {:>9}'.format('Seq len', 'Rows', 'KB/batch', 'Pipe (us)', 'Shm (us)',
+                                                         'Speedup'))
+    for seq_len, (pipe_time, shm_time) in zip(seq_lens, results):
+        print('{:<8} {:>8} {:>10.1f} {:>12.1f} {:>12.1f} {:>8.2f}x'.format(
+            seq_len, FLAGS.cs_batch_size_reg, FLAGS.cs_batch_size_reg * seq_len * 4 / 1024, pipe_time * 1e6,
+            shm_time * 1e6, pipe_time / shm_time))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
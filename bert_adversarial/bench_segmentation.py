@@ -0,0 +1,108 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import glob
+import os
+import time
+from bert_adversarial.core.api.extraction import PageReader
+from bert_adversarial.core.api.segmentation import get_segmenter, load_punkt
+from bert_adversarial.core.utils import transformations as transf
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+
+REPEATS = 5
+
+
+def chunked(text, chunk_chars):
+    return [text[i:i + chunk_chars] for i in range(0, len(text), chunk_chars)]
+
+
+def legacy_stream(chunks):
+    # /score/stream segmentation before SegmentStream: re-tokenize the carried-over sentence plus each new chunk
+    ret, buffer = [], ''
+    for chunk in chunks:
+        buffer += chunk
+        sentences = transf.sentence_tokenize(buffer)
+        if sentences:
+            buffer = sentences.pop()
+            ret += [x for x in (s.strip() for s in sentences) if x]
+    return ret + ([buffer.strip()] if buffer.strip() else [])
+
+
+def warm_stream(chunks):
+    return [x.text for x in get_segmenter().iter_sentences(chunks)]
+
+
+def timed(fn, inputs):
+    fn(inputs[:1])
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        ret = fn(inputs)
+    return ret, (time.perf_counter() - start) / REPEATS
+
+
+def main():
+    page_locs = sorted(glob.glob(os.path.join(FLAGS.cs_bench_pages_dir, '*.htm*')))
+    if not page_locs:
+        raise Exception('No .html pages found in {}'.format(FLAGS.cs_bench_pages_dir))
+
+    pages = []
+    for loc in page_locs:
+        reader = PageReader('text/html')
+        with open(loc, 'rb') as f:
+            pages.append(reader.feed(f.read()) + reader.close())
+    blocks = [x for page in pages for x in page]
+    documents = ['\n\n'.join(page) for page in pages]
+    logging.info('Loaded {} pages: {} blocks, {} characters'.format(len(pages), len(blocks),
+                                                                  sum(len(x) for x in documents)))
+
+    # What the first request of a process pays when Punkt is loaded on demand
+    start = time.perf_counter()
+    load_punkt()
+    print('Punkt load: {:.1f} ms'.format((time.perf_counter() - start) * 1e3))
+
+    segmenter = get_segmenter()
+    cases = [
+        ('blocks', blocks, lambda x: [transf.sentence_tokenize(b) for b in x], segmenter.segment_batch),
+        ('documents', documents, lambda x: [transf.sentence_tokenize(d) for d in x], segmenter.segment_batch),
+    ]
+    # /score/stream as uploaded in 1 KB chunks, and as a client sending a few words at a time
+    for chunk_chars in [1024, 32]:
+        cases.append(('stream/{}'.format(chunk_chars), documents,
+                      lambda x, n=chunk_chars: [legacy_stream(chunked(d, n)) for d in x],
+                      lambda x, n=chunk_chars: [warm_stream(chunked(d, n)) for d in x]))
+
+    # Both pipelines should give exactly what segmenting each whole input at once gives
+    print('{:<12} {:>10} {:>12} {:>12} {:>9} {:>11} {:>9}'.format('Input', 'Sentences', 'Current (ms)', 'Warm (ms)',
+                                                                'Speedup', 'Current ok', 'Warm ok'))
+    for name, inputs, current_fn, warm_fn in cases:
+        expected = [transf.sentence_tokenize(x) for x in inputs]
+        current, current_time = timed(current_fn, inputs)
+        warm, warm_time = timed(warm_fn, inputs)
+        print('{:<12} {:>10} {:>12.1f} {:>12.1f} {:>8.2f}x {:>11} {:>9}'.format(
+            name, sum(len(x) for x in expected), current_time * 1e3, warm_time * 1e3, current_time / warm_time,
+            'yes' if current == expected else 'no', 'yes' if warm == expected else 'no'))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
@@ -0,0 +1,84 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import json
+import numpy as np
+from absl import logging
+from sklearn.metrics import f1_score
+from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+from bert_adversarial.core.api.cascade import SVMScorer
+from bert_adversarial.core.utils.compute_ndcg import compute_ndcg
+from bert_adversarial.core.utils.data_loader import DataLoader
+from bert_adversarial.core.utils.flags import FLAGS
+
+
+def cascade_stats(labels, bert_scores, svm_scores, margins, low, high):
+    confident = (margins < low) | (margins > high)
+    scores = np.where(confident[:, None], svm_scores, bert_scores)
+    f1 = f1_score(labels, np.argmax(scores, axis=1), average='weighted')
+    ndcg = compute_ndcg(labels, scores[:, FLAGS.cs_num_classes - 1].tolist())
+    return f1, ndcg, 1.0 - np.mean(confident)
+
+
+def main():
+    dev_data = DataLoader.parse_json(FLAGS.cs_raw_dj_eval_loc)
+    sentences, labels = [x[0] for x in dev_data], [x[1] for x in dev_data]
+    logging.info('Calibrating on {} sentences from {}'.format(len(sentences), FLAGS.cs_raw_dj_eval_loc))
+
+    svm = SVMScorer(FLAGS.cs_svm_model_dir, FLAGS.cs_svm_model_name)
+    margins = svm.margins(sentences)
+    svm_scores = svm.margins_to_scores(margins)
+
+    api = ClaimSpotterAPI(num_replicas=1, executor_type='thread', use_cache=False, use_cascade=False)
+    bert_scores = np.array(api.batch_sentence_query(sentences))
+
+    base_f1, base_ndcg, _ = cascade_stats(labels, bert_scores, svm_scores, margins, -np.inf, np.inf)
+    svm_f1, svm_ndcg, _ = cascade_stats(labels, bert_scores, svm_scores, margins, np.inf, np.inf)
+    print('Transformer only | F1: {:.4f} nDCG: {:.4f}'.format(base_f1, base_ndcg))
+    print('SVM only         | F1: {:.4f} nDCG: {:.4f}'.format(svm_f1, svm_ndcg))
+
+    # Candidate band edges are margin quantiles, so every step moves roughly the same number of sentences
+    lows = np.unique(np.quantile(margins[margins <= 0], np.linspace(0, 1, 51))) if np.any(margins <= 0) else [0.0]
+    highs = np.unique(np.quantile(margins[margins >= 0], np.linspace(0, 1, 51))) if np.any(margins >= 0) else [0.0]
+
+    best = (-np.inf, np.inf, base_f1, base_ndcg, 1.0)
+    for low in lows:
+        for high in highs:
+            f1, ndcg, forwarded = cascade_stats(labels, bert_scores, svm_scores, margins, low, high)
+            if base_f1 - f1 <= FLAGS.cs_cascade_max_f1_loss and base_ndcg - ndcg <= FLAGS.cs_cascade_max_ndcg_loss \
+                    and forwarded < best[4]:
+                best = (low, high, f1, ndcg, forwarded)
+
+    low, high, f1, ndcg, forwarded = best
+    print('Cascade          | F1: {:.4f} nDCG: {:.4f} | band [{:.4f}, {:.4f}] forwards {:.2f}% to the transformer'
+          .format(f1, ndcg, low, high, forwarded * 100))
+
+    with open(FLAGS.cs_cascade_out, 'w') as f:
+        json.dump({'svm_model_dir': FLAGS.cs_svm_model_dir, 'svm_model_name': FLAGS.cs_svm_model_name,
+                   'low': float(low), 'high': float(high), 'f1': f1, 'ndcg': ndcg, 'base_f1': base_f1,
+                   'base_ndcg': base_ndcg, 'forwarded': forwarded}, f, indent=2)
+    print('Wrote {}'.format(FLAGS.cs_cascade_out))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
@@ -0,0 +1,133 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import asyncio
+import math
+from collections import deque
+from bert_adversarial.core.api.batcher import normalize_sentence
+from bert_adversarial.core.utils.flags import FLAGS
+
+
+class Overloaded(Exception):
+    def __init__(self, status, reason, retry_after):
+        super(Overloaded, self).__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class InvalidDeadline(ValueError):
+    pass
+
+
+class AdmissionController:
+    """
+    Decides up front whether a scoring request can finish before its deadline.
+
+    At most `max_outstanding` sentences are admitted at once; beyond that requests are rejected with 429. A request is
+    rejected with 503 when the admitted sentences ahead of it would take longer than its deadline to score. Throughput
+    is the rate observed over the last `rate_window` seconds, which reflects batching and event loop overhead under
+    load, or the API's per-sentence service time while too little has completed recently to measure it. Admitted
+    requests are cancelled once their deadline passes, which also drops their sentences from the micro-batcher and the
+    executor queue before they reach a model.
+    """
+
+    def __init__(self, api, max_outstanding=None, deadline_ms=None, degraded=None):
+        self.api = api
+        self.max_outstanding = max_outstanding or FLAGS.cs_serve_max_queue
+        self.deadline = (deadline_ms if deadline_ms is not None else FLAGS.cs_serve_deadline_ms) / 1000.0
+        self.degraded = degraded or FLAGS.cs_serve_degraded
+
+        self.outstanding = 0
+        self.rate_window = 2.0
+        self.completions = deque()
+        self.completed = 0
+        self.counters = {'admitted': 0, 'rejected_queue': 0, 'rejected_wait': 0, 'expired': 0, 'degraded': 0}
+
+    def timeout_for(self, headers):
+        # Clients may ask for a tighter (or looser) budget than the server default
+        requested = headers.get('x-deadline-ms')
+        if requested:
+            try:
+                ms = float(requested)
+            except ValueError:
+                ms = math.nan
+            if not math.isfinite(ms) or ms < 0:
+                raise InvalidDeadline('X-Deadline-Ms must be a non-negative number of milliseconds')
+            return max(0.001, ms / 1000.0)
+        return self.deadline or None
+
+    def throughput(self):
+        now = asyncio.get_event_loop().time()
+        while self.completions and self.completions[0][0] < now - self.rate_window:
+            self.completed -= self.completions.popleft()[1]
+
+        if self.completed >= self.api.num_replicas * FLAGS.cs_batch_size_reg:
+            return self.completed / self.rate_window
+        return max(1, self.api.num_replicas) / self.api.sec_per_sentence if self.api.sec_per_sentence else math.inf
+
+    def estimated_wait(self, cost):
+        return (self.outstanding + cost) / self.throughput()
+
+    def check(self, cost, timeout):
+        wait = self.estimated_wait(cost)
+        if self.outstanding + cost > self.max_outstanding:
+            self.counters['rejected_queue'] += 1
+            raise Overloaded(429, 'Too many sentences queued', max(1, math.ceil(wait)))
+        if timeout is not None and wait > timeout:
+            self.counters['rejected_wait'] += 1
+            raise Overloaded(503, 'Estimated wait of {:.2f}s exceeds the deadline'.format(wait), max(1, math.ceil(wait)))
+
+    async def run(self, sentences, timeout, score_fn, cost=None, allow_degraded=True):
+        """
+        Scores `sentences` with the coroutine function `score_fn` if admitted. Returns the scores and, when the
+        request was served in degraded mode instead, the name of that mode (otherwise None). Inputs other than text
+        give their own `cost` in sentences, and cannot be served in degraded mode.
+        """
+        # Repeated sentences are only scored once
+        cost = cost if cost is not None else len(set(normalize_sentence(x) for x in sentences))
+        try:
+            self.check(cost, timeout)
+        except Overloaded:
+            scores = await self._degraded_scores(sentences) if allow_degraded else None
+            if scores is None:
+                raise
+            self.counters['degraded'] += 1
+            return scores, self.degraded
+
+        self.counters['admitted'] += 1
+        self.outstanding += cost
+        try:
+            ret = await asyncio.wait_for(score_fn(sentences), timeout)
+            self.completions.append((asyncio.get_event_loop().time(), cost))
+            self.completed += cost
+            return ret, None
+        except asyncio.TimeoutError:
+            self.counters['expired'] += 1
+            raise Overloaded(503, 'Deadline exceeded', max(1, math.ceil(self.estimated_wait(0))))
+        finally:
+            self.outstanding -= cost
+
+    async def _degraded_scores(self, sentences):
+        if self.degraded == 'off':
+            return None
+        return await asyncio.get_event_loop().run_in_executor(None, self.api.degraded_query, sentences, self.degraded)
@@ -20,60 +20,503 @@
 #     Arlington, TX 76019
 #
 
+import asyncio
+import gc
+import hashlib
+import math
 import os
-from bert_adversarial.core.models.model import ClaimSpotterModel
+import threading
+import time
+import queue
+import numpy as np
+from itertools import groupby
+from contextlib import contextmanager
+from bert_adversarial.core.api.batcher import SingleFlight, dedupe, normalize_sentence, split_balanced, \
+    split_by_token_budget
+from bert_adversarial.core.api.cache import PredictionCache
+from bert_adversarial.core.api.cascade import Cascade, SVMScorer
+from bert_adversarial.core.api.metrics import timed_stage, observe_batch_size
+from bert_adversarial.core.api.executor import InferenceExecutor, pin_intra_op_threads, process_intra_op_threads, \
+    pinned_intra_op_threads
+from bert_adversarial.core.models.model import ClaimSpotterModel, ClaimSpotterPredictor, SavedModelPredictor, \
+    QuantizedPredictor
 from bert_adversarial.core.models.advbert.tokenization.bert_tokenization import AdvFullTokenizer
+from bert_adversarial.core.models.custom_albert_tokenization import CustomAlbertTokenizer
 from bert_adversarial.core.utils.data_loader import DataLoader
 from bert_adversarial.core.utils import transformations as transf
 from bert_adversarial.core.utils.flags import FLAGS
 from absl import logging
-import tensorflow as tf
+
+# Left in a replica queue once a hot swap has drained it
+_RETIRED = object()
 
 
 class ClaimSpotterAPI:
-    def __init__(self):
+    # Label of this model's metrics; the model registry sets the name it is served under
+    name = 'default'
+
+    def __init__(self, num_replicas=None, executor_type=None, use_cache=True, use_cascade=True, saved_model_dir=None,
+                 doc_workers=None):
         logging.set_verbosity(logging.INFO)
         os.environ['CUDA_VISIBLE_DEVICES'] = ','.join([str(z) for z in FLAGS.cs_gpu])
         os.environ['TF_FORCE_GPU_ALLOW_GROWTH'] = 'true'
 
         self.return_strings = ['Non-factual sentence', 'Check-worthy factual statement']
-        self.tokenizer = AdvFullTokenizer(os.path.join(FLAGS.cs_model_loc, "vocab.txt"), do_lower_case=True)
+        self.saved_model_dir = saved_model_dir or FLAGS.cs_serve_saved_model
+        self.quantized = FLAGS.cs_serve_quantized and saved_model_dir is None
+        self.max_len = SavedModelPredictor.config(self.saved_model_dir)['max_len'] if self.saved_model_dir else \
+            FLAGS.cs_max_len
+        # Checkpoint folder (or SavedModel directory) being served; None follows the latest one in cs_model_dir
+        self.model_loc = None
+        self.tokenizer = self._build_tokenizer()
 
         transf.load_dependencies()
 
-        self.model = ClaimSpotterModel()
-        self.model.warm_up()
-        self.model.load_custom_model()
+        self.length_buckets = sorted(set([int(x) for x in FLAGS.cs_serve_length_buckets if int(x) < self.max_len] +
+                                         [self.max_len]))
+
+        self.executor_type = executor_type if executor_type is not None else FLAGS.cs_serve_executor
+        self.num_replicas = num_replicas if num_replicas is not None else FLAGS.cs_serve_replicas
+
+        # In process mode the replicas live in the worker processes, so the parent holds no model of its own.
+        # In prefork mode TF must not be initialized before the HTTP workers fork; they attach proxies afterwards.
+        self.replicas = queue.Queue()
+        self.num_local_replicas = self.num_replicas if self.executor_type == 'thread' else 0
+
+        # Large documents can be scored on a pool of worker processes with their own models, so preprocessing is not
+        # confined to this process's GIL. Like the `process` executor, it is forked before any model is built here.
+        doc_workers = doc_workers if doc_workers is not None else FLAGS.cs_serve_doc_workers
+        self.doc_executor = None
+        if doc_workers > 0 and self.executor_type == 'thread':
+            self.doc_executor = InferenceExecutor(self, 'process', doc_workers)
+
+        if self.num_local_replicas:
+            pin_intra_op_threads(process_intra_op_threads(self.executor_type, self.num_local_replicas))
+        for _ in range(self.num_local_replicas):
+            self.replicas.put(self._build_model())
+
+        self.cascade = Cascade(FLAGS.cs_serve_cascade) if FLAGS.cs_serve_cascade and use_cascade else None
+        self.fallback_svm = None
+        if FLAGS.cs_serve_degraded == 'svm' and use_cascade:
+            self.fallback_svm = (self.cascade.svm if self.cascade is not None else
+                                 SVMScorer(FLAGS.cs_svm_model_dir, FLAGS.cs_svm_model_name))
+
+        # Moving average of the model time per uncached sentence on one replica, used for admission control
+        self.sec_per_sentence = 0.0
+
+        self.executor = InferenceExecutor(self, self.executor_type, self.num_replicas)
+        self.single_flight = SingleFlight()
+
+        self.model_identity = self._model_identity()
+        self.swap_lock = threading.Lock()
+
+        self.cache = None
+        if use_cache and FLAGS.cs_serve_cache_size > 0:
+            self.cache = PredictionCache(self.model_identity, FLAGS.cs_serve_cache_size, FLAGS.cs_serve_cache_db)
+
+    def _model_identity(self, loc=None):
+        loc = loc if loc is not None else self.model_loc
+        if self.quantized:
+            ret = QuantizedPredictor.identity(loc or self.saved_model_dir)
+        elif self.saved_model_dir:
+            ret = SavedModelPredictor.identity(loc or self.saved_model_dir)
+        else:
+            ret = ClaimSpotterModel.checkpoint_identity(loc)
+        return ret + ('|' + self.cascade.identity() if self.cascade is not None else '')
+
+    def _build_tokenizer(self, loc=None):
+        if self.saved_model_dir:
+            assets = os.path.join(loc or self.saved_model_dir, 'assets')
+            vocab_file = 'vocab.txt' if os.path.isfile(os.path.join(assets, 'vocab.txt')) else '30k-clean.model'
+            return load_tokenizer(os.path.join(assets, vocab_file))
+        return load_tokenizer(os.path.join(FLAGS.cs_model_loc,
+                                           'vocab.txt' if FLAGS.cs_tfm_type == 'bert' else '30k-clean.model'))
+
+    def _build_model(self, loc=None):
+        loc = loc if loc is not None else self.model_loc
+        if self.quantized:
+            # Unlike TF, every TFLite interpreter has threads of its own, so the local replicas split them
+            replica = QuantizedPredictor(loc or self.saved_model_dir, num_threads=max(
+                1, pinned_intra_op_threads() // max(1, self.num_local_replicas)))
+        elif self.saved_model_dir:
+            replica = SavedModelPredictor(loc or self.saved_model_dir)
+        else:
+            model = ClaimSpotterModel()
+            model.warm_up()
+            model.load_custom_model(loc)
+            replica = ClaimSpotterPredictor(model)
+
+        if FLAGS.cs_serve_prewarm:
+            self._prewarm(replica)
+        return replica
+
+    def _prewarm(self, replica):
+        """
+        Scores one batch at each padded length the replica can be sent. Batches are only ever padded to a length
+        bucket and the batch dimension is dynamic, so no request pays for tracing or first-call allocation.
+        """
+        start = time.perf_counter()
+        for seq_len in self.length_buckets:
+            replica.preds_on_batch((np.zeros((1, seq_len), dtype=np.int32), np.zeros((1, 2), dtype=np.float32)))
+        logging.info('Prewarmed padded lengths {} in {:.2f}s'.format(self.length_buckets, time.perf_counter() - start))
+
+    def attach_remote_predictors(self, predictors):
+        for predictor in predictors:
+            self.replicas.put(predictor)
+        self.num_local_replicas = len(predictors)
+
+        if self.cache is not None:
+            self.cache.connect()
+
+    def load_custom_model(self, loc=None):
+        return self.hot_swap(loc)
+
+    def hot_swap(self, loc=None):
+        """
+        Serves the checkpoint folder (or SavedModel directory) at `loc` without downtime. New replicas are built and
+        warmed next to the serving ones and validated on the canary set; traffic then switches over in one reference
+        swap. Batches already running finish on the old replicas, which are released once all of them are returned.
+        Returns the identity of the model now being served.
+        """
+        if self.executor_type != 'thread':
+            raise RuntimeError('Cannot swap models in `{}` executor mode, restart the workers instead'.format(
+                self.executor_type))
+        # The document workers were forked before TF started here and cannot be forked again with the new model
+        if self.doc_executor is not None:
+            raise RuntimeError('Cannot swap models while {} document workers (cs_serve_doc_workers) serve the current '
+                               'one, restart the server instead'.format(self.doc_executor.num_replicas))
+
+        with self.swap_lock:
+            identity = self._model_identity(loc)
+            logging.info('Loading replacement model {}'.format(identity))
+
+            tokenizer = self._build_tokenizer(loc)
+            new_replicas = queue.Queue()
+            for _ in range(self.num_local_replicas):
+                replica = self._build_model(loc)
+                self._validate_replica(replica, tokenizer)
+                new_replicas.put(replica)
+
+            old_replicas = self.replicas
+            self.tokenizer, self.replicas, self.model_loc, self.model_identity = tokenizer, new_replicas, loc, identity
+            if self.cache is not None:
+                self.cache.set_model_id(identity)
+
+            # `_checkout_model` returns each replica to the queue it came from, so this waits for in-flight batches.
+            # Threads still waiting on the drained queue find the marker and move on to the new replicas.
+            retired = [old_replicas.get() for _ in range(self.num_local_replicas)]
+            old_replicas.put(_RETIRED)
+            del retired, old_replicas
+            gc.collect()
+
+            logging.info('Now serving {}'.format(identity))
+            return identity
+
+    def _validate_replica(self, replica, tokenizer):
+        sentences, labels = load_canary_set()
+        sentence_list, sentiments = self._extract_info(sentences)
+        features = encode_sentences(tokenizer, sentence_list)
+        preds = [None for _ in sentences]
+        for idx, x, x_sent in self._create_bucketed_batches(features, sentiments):
+            for i, pred in zip(idx, np.asarray(replica.preds_on_batch((x, x_sent))).tolist()):
+                preds[i] = pred
+        preds = np.array(preds)
+
+        if not np.all(np.isfinite(preds)) or not np.allclose(preds.sum(axis=1), 1.0, atol=1e-3):
+            raise ValueError('Canary check failed: the replacement model returned invalid probabilities')
+        if labels is not None:
+            acc = np.mean(np.argmax(preds, axis=1) == np.array(labels))
+            if acc < FLAGS.cs_serve_canary_min_acc:
+                raise ValueError('Canary check failed: accuracy {:.4f} < {}'.format(acc, FLAGS.cs_serve_canary_min_acc))
+
+    @contextmanager
+    def _checkout_model(self):
+        if not self.num_local_replicas:
+            raise RuntimeError('No local model replicas in `{}` executor mode, use the async_* queries instead'.format(
+                self.executor_type))
+
+        while True:
+            replicas = self.replicas
+            with timed_stage('replica_wait', self.name):
+                model = replicas.get()
+            if model is not _RETIRED:
+                break
+            # Drained by a hot swap: the marker stays for any other waiter
+            replicas.put(model)
+        try:
+            yield model
+        finally:
+            replicas.put(model)
+
+    async def async_single_sentence_query(self, sentence):
+        return await self.async_batch_sentence_query([sentence])
+
+    async def async_batch_sentence_query(self, sentence_list, executor=None):
+        # Identical sentences already being scored for another request are awaited instead of scored again
+        sentence_list = [x.strip('\n\r\t ') for x in sentence_list]
+        return await self.single_flight.run(sentence_list, lambda x: self._async_batch_query(x, executor),
+                                            normalize_sentence)
+
+    async def _async_batch_query(self, sentence_list, executor=None):
+        if self.cache is None:
+            return await self._run_uncached(sentence_list, executor)
+
+        model_id = self.cache.model_id
+        with timed_stage('cache_lookup', self.name):
+            ret, misses = await self._run_cache(self.cache.lookup, sentence_list)
+        if misses:
+            miss_list = [sentence_list[i] for i in misses]
+            miss_scores = await self._run_uncached(miss_list, executor)
+            await self._run_cache(self._fill_cache_misses, ret, misses, miss_list, miss_scores, model_id)
+        return ret
+
+    async def _run_cache(self, fn, *args):
+        # The sqlite tier reads and commits on disk, which must not hold up the event loop. The in-memory tier alone
+        # is cheaper than the hop to a thread.
+        if self.cache.db is None:
+            return fn(*args)
+        return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+    async def _run_uncached(self, sentence_list, executor=None):
+        executor = executor or self.executor
+        start = time.perf_counter()
+        with timed_stage('executor', self.name):
+            ret = await executor.run('query_uncached', sentence_list)
+
+        # Process workers cannot update the parent's estimate, so fall back to the (queue-inclusive) round trip
+        if executor.executor_type == 'process':
+            self._record_service_time(len(sentence_list), time.perf_counter() - start)
+        return ret
+
+    def _record_service_time(self, num_sentences, elapsed):
+        if num_sentences:
+            self.sec_per_sentence += 0.2 * (elapsed / num_sentences - self.sec_per_sentence)
+
+    def degraded_query(self, sentence_list, mode):
+        """
+        Scores without touching a model replica: cached predictions only (`mode='cache'`, None unless all of them
+        hit), or cached predictions with the SVM filling in the misses (`mode='svm'`).
+        """
+        sentence_list = [x.strip('\n\r\t ') for x in sentence_list]
+        ret, misses = self.cache.lookup(sentence_list) if self.cache is not None else \
+            ([None for _ in sentence_list], list(range(len(sentence_list))))
+
+        if misses and mode == 'svm' and self.fallback_svm is not None:
+            scores = self.fallback_svm.margins_to_scores(self.fallback_svm.margins([sentence_list[i] for i in misses]))
+            for i, pred in zip(misses, scores.tolist()):
+                ret[i] = pred
+        elif misses:
+            return None
+        return ret
+
+    async def async_document_query(self, sentence_list, token_budget=None):
+        """
+        Splits a long document into contiguous shards of about `token_budget` tokens, scores them concurrently across
+        the replicas (or the document worker processes, for documents of at least cs_serve_doc_min_sentences) and
+        merges the scores back in document order. The number of shards is a multiple of the number of workers and the
+        shards are balanced by token count, so the workers finish together instead of waiting on one straggler.
+        """
+        executor = self.executor
+        if self.doc_executor is not None and len(sentence_list) >= FLAGS.cs_serve_doc_min_sentences:
+            executor = self.doc_executor
+
+        total = sum(self.estimate_token_count(x) for x in sentence_list)
+        num_shards = math.ceil(total / (token_budget or FLAGS.cs_serve_token_budget) / executor.num_replicas)
+        shards = split_balanced(sentence_list, max(1, num_shards) * executor.num_replicas, self.estimate_token_count)
+        for shard in shards:
+            observe_batch_size('shard', len(shard), self.name)
+
+        results = await asyncio.gather(*[self.async_batch_sentence_query(x, executor) for x in shards])
+        return [scores for shard in results for scores in shard]
+
+    @property
+    def vocab_size(self):
+        return tokenizer_vocab_size(self.tokenizer)
+
+    def check_token_ids(self, input_ids, sentiments=None):
+        """
+        Validates pre-tokenized input: one list of token ids per sentence, as this model's tokenizer produces them
+        (including [CLS] and [SEP] for BERT), and optionally one [polarity, subjectivity] pair per sentence. Missing
+        sentiment features default to [0.0, 0.0], TextBlob's value for text with no sentiment. Returns a list of
+        (token ids, sentiment) pairs for `async_ids_query`, or raises ValueError.
+        """
+        if not isinstance(input_ids, list):
+            raise ValueError('`input_ids` must be a list of token id lists')
+        if sentiments is None:
+            sentiments = [[0.0, 0.0] for _ in input_ids]
+        if not isinstance(sentiments, list) or len(sentiments) != len(input_ids):
+            raise ValueError('`sentiments` must be a list with one [polarity, subjectivity] pair per sentence')
+
+        vocab_size = self.vocab_size
+        for i, (ids, sentiment) in enumerate(zip(input_ids, sentiments)):
+            if not isinstance(ids, list) or not ids or not all(type(x) is int for x in ids):
+                raise ValueError('`input_ids[{}]` must be a non-empty list of integers'.format(i))
+            if len(ids) > self.max_len:
+                raise ValueError('`input_ids[{}]` has {} tokens, more than the max length of {}'.format(
+                    i, len(ids), self.max_len))
+            if min(ids) < 0 or max(ids) >= vocab_size:
+                raise ValueError('`input_ids[{}]` has token ids outside the vocabulary of size {}'.format(i, vocab_size))
+            if not isinstance(sentiment, list) or len(sentiment) != 2 or \
+                    not all(type(x) in [int, float] and math.isfinite(x) for x in sentiment) or \
+                    not -1.0 <= sentiment[0] <= 1.0 or not 0.0 <= sentiment[1] <= 1.0:
+                raise ValueError('`sentiments[{}]` must be [polarity in [-1, 1], subjectivity in [0, 1]]'.format(i))
+
+        return [(ids, [float(x) for x in sentiment]) for ids, sentiment in zip(input_ids, sentiments)]
+
+    async def async_ids_query(self, items, token_budget=None):
+        """
+        Scores (token ids, sentiment) pairs from `check_token_ids` in token-budgeted batches, concurrently across the
+        replicas. Normalization, sentiment analysis, tokenization, the cascade and the prediction cache are skipped.
+        """
+        batches = split_by_token_budget(items, token_budget or FLAGS.cs_serve_token_budget, lambda x: len(x[0]))
+        results = await asyncio.gather(*[self.executor.run('ids_query', x) for x in batches])
+        return [scores for batch in results for scores in batch]
+
+    def ids_query(self, items):
+        start = time.perf_counter()
+        ret = self._retrieve_model_preds(self._create_bucketed_batches([x[0] for x in items], [x[1] for x in items]))
+        self._record_service_time(len(items), time.perf_counter() - start)
+        return ret
+
+    def estimate_token_count(self, sentence):
+        # Whitespace words plus [CLS]/[SEP]; a cheap stand-in for WordPiece that avoids tokenizing twice. Longer
+        # sentences are truncated to this model's max_len, which may differ from cs_max_len for an export.
+        return min(len(sentence.split()) + 2, self.max_len)
 
     def subscribe_cmdline_query(self):
         print('Enter a sentence to process')
-        return self._retrieve_model_preds(self._prc_sentence_list([input().strip('\n\r\t ')]))
+        return self.batch_sentence_query([input()])
 
     def single_sentence_query(self, sentence):
-        return self._retrieve_model_preds(self._prc_sentence_list([sentence.strip('\n\r\t ')]))
+        return self.batch_sentence_query([sentence])
 
     def batch_sentence_query(self, sentence_list):
         sentence_list = [x.strip('\n\r\t ') for x in sentence_list]
-        return self._retrieve_model_preds(self._prc_sentence_list(sentence_list))
+        if self.cache is None:
+            return self.query_uncached(sentence_list)
+
+        model_id = self.cache.model_id
+        with timed_stage('cache_lookup', self.name):
+            ret, misses = self.cache.lookup(sentence_list)
+        if misses:
+            miss_list = [sentence_list[i] for i in misses]
+            self._fill_cache_misses(ret, misses, miss_list, self.query_uncached(miss_list), model_id)
+        return ret
+
+    def preds_on_batch(self, x):
+        with self._checkout_model() as model:
+            return np.asarray(model.preds_on_batch(x))
+
+    def query_uncached(self, sentence_list):
+        # Repeated sentences within a batch are scored once and fanned out
+        start = time.perf_counter()
+        unique, index = dedupe(sentence_list, normalize_sentence)
+        ret = self._query_uncached(unique)
+        self._record_service_time(len(unique), time.perf_counter() - start)
+        return [ret[i] for i in index]
+
+    def _query_uncached(self, sentence_list):
+        if self.cascade is None:
+            return self._retrieve_model_preds(self._prc_sentence_list(sentence_list))
+
+        with timed_stage('cascade', self.name):
+            ret, ambiguous = self.cascade.screen(sentence_list)
+        if ambiguous:
+            preds = self._retrieve_model_preds(self._prc_sentence_list([sentence_list[i] for i in ambiguous]))
+            for i, pred in zip(ambiguous, preds):
+                ret[i] = pred
+        return ret
+
+    def _fill_cache_misses(self, ret, misses, miss_list, miss_scores, model_id):
+        with timed_stage('cache_store', self.name):
+            self.cache.store(miss_list, miss_scores, model_id)
+        for i, scores in zip(misses, miss_scores):
+            ret[i] = scores
 
     def _prc_sentence_list(self, sentence_list):
         sentence_features = self._extract_info(sentence_list)
-        return tf.data.Dataset.from_tensor_slices(
-            (self._create_bert_features(sentence_features[0]), sentence_features[1])).batch(FLAGS.cs_batch_size_reg)
+        return self._create_bucketed_batches(self._create_bert_features(sentence_features[0]), sentence_features[1])
 
-    def _retrieve_model_preds(self, dataset):
-        ret = []
-        for x, x_sent in dataset:
-            ret = ret + self.model.preds_on_batch((x, x_sent)).numpy().tolist()
+    def _retrieve_model_preds(self, batches):
+        ret = [None for _ in range(sum(len(idx) for idx, _, _ in batches))]
+        with self._checkout_model() as model:
+            for idx, x, x_sent in batches:
+                observe_batch_size('model', len(idx), self.name)
+                with timed_stage('model', self.name):
+                    preds = np.asarray(model.preds_on_batch((x, x_sent))).tolist()
+                for i, pred in zip(idx, preds):
+                    ret[i] = pred
         return ret
 
     def _create_bert_features(self, sentence_list):
-        features = [self.tokenizer.convert_tokens_to_ids(self.tokenizer.tokenize(x))
-                    for x in sentence_list]
-        return DataLoader.pad_seq(features)
-
-    @staticmethod
-    def _extract_info(sentence_list):
-        r_sentence_list = [transf.transform_sentence_complete(x) for x in sentence_list]
-        r_sentiment_list = [transf.get_sentiment(x) for x in sentence_list]
+        with timed_stage('tokenize', self.name):
+            return encode_sentences(self.tokenizer, sentence_list)
+
+    def _create_bucketed_batches(self, features, sentiments):
+        # Sorting by length lets each batch be padded to the smallest bucket that fits, instead of cs_max_len
+        order = sorted(range(len(features)), key=lambda i: len(features[i]))
+        batches = []
+
+        with timed_stage('pad', self.name):
+            for seq_len, bucket in groupby(order, key=lambda i: self._bucket_length(len(features[i]))):
+                bucket = list(bucket)
+                for start in range(0, len(bucket), FLAGS.cs_batch_size_reg):
+                    idx = bucket[start:start + FLAGS.cs_batch_size_reg]
+                    batches.append((idx,
+                                    DataLoader.pad_seq([features[i] for i in idx], maxlen=seq_len).astype(np.int32),
+                                    np.array([sentiments[i] for i in idx], dtype=np.float32)))
+
+        return batches
+
+    def _bucket_length(self, seq_len):
+        return next(x for x in self.length_buckets if seq_len <= x or x == self.max_len)
+
+    def _extract_info(self, sentence_list):
+        with timed_stage('transform', self.name):
+            r_sentence_list = [transf.transform_sentence_complete(x) for x in sentence_list]
+        with timed_stage('sentiment', self.name):
+            r_sentiment_list = [transf.get_sentiment(x) for x in sentence_list]
         return r_sentence_list, r_sentiment_list
+
+
+_tokenizers = {}
+_tokenizers_lock = threading.Lock()
+
+
+def load_tokenizer(vocab_file):
+    """
+    Returns the tokenizer for a WordPiece vocabulary, or an ALBERT SentencePiece `.model` file. Models whose files have
+    the same contents (e.g. every uncased BERT-base checkpoint) share one tokenizer.
+    """
+    with open(vocab_file, 'rb') as f:
+        key = hashlib.sha1(f.read()).hexdigest()
+
+    with _tokenizers_lock:
+        if key not in _tokenizers:
+            _tokenizers[key] = CustomAlbertTokenizer(vocab_file) if vocab_file.endswith('.model') else \
+                AdvFullTokenizer(vocab_file, do_lower_case=True)
+        return _tokenizers[key]
+
+
+def tokenizer_vocab_size(tokenizer):
+    if isinstance(tokenizer, CustomAlbertTokenizer):
+        return tokenizer.model.get_piece_size()
+    return len(tokenizer.vocab)
+
+
+def encode_sentences(tokenizer, sentence_list):
+    if isinstance(tokenizer, CustomAlbertTokenizer):
+        return tokenizer.tokenize_array(sentence_list)
+    return [tokenizer.convert_tokens_to_ids(tokenizer.tokenize(x)) for x in sentence_list]
+
+
+# Used to validate replacement models when no --cs_serve_canary_file is given; only checks for valid probabilities
+DEFAULT_CANARY = ['Donald Trump is the 45th President of the United States.', 'I really like cheese.',
+                  'Unemployment fell to 3.5 percent last year.', 'Thank you all for coming tonight.']
+
+
+def load_canary_set():
+    if not FLAGS.cs_serve_canary_file:
+        return DEFAULT_CANARY, None
+    canary = DataLoader.parse_json(FLAGS.cs_serve_canary_file)
+    return [x[0] for x in canary], [x[1] for x in canary]
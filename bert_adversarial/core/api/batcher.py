@@ -0,0 +1,227 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import asyncio
+from bert_adversarial.core.api.metrics import observe_batch_size
+from bert_adversarial.core.utils.flags import FLAGS
+
+
+def split_by_token_budget(items, token_budget, cost_fn):
+    batches, cur, cur_cost = [], [], 0
+
+    for item in items:
+        cost = cost_fn(item)
+        if cur and cur_cost + cost > token_budget:
+            batches.append(cur)
+            cur, cur_cost = [], 0
+        cur.append(item)
+        cur_cost += cost
+
+    if cur:
+        batches.append(cur)
+    return batches
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item requests into batches for `batch_fn`.
+
+    A batch is flushed once it holds `max_batch_size` items or once its oldest item has waited `max_wait_ms`.
+    `batch_fn` is a coroutine function mapping a list of items to a list of results of the same length. `labels` are
+    attached to the batch size metric, e.g. `model='svm'`.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=None, max_wait_ms=None, max_concurrency=1, labels=None):
+        self.batch_fn = batch_fn
+        self.labels = labels or {}
+        self.max_batch_size = max_batch_size or FLAGS.cs_serve_max_batch_size or FLAGS.cs_batch_size_reg
+        self.max_wait = (max_wait_ms if max_wait_ms is not None else FLAGS.cs_serve_max_wait_ms) / 1000.0
+
+        self.queue = None
+        self.worker = None
+        self.flush_slots = None
+        self.max_concurrency = max_concurrency
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.flush_slots = asyncio.Semaphore(self.max_concurrency)
+        self.worker = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        if self.worker is not None:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    async def submit(self, item):
+        fut = asyncio.get_event_loop().create_future()
+        await self.queue.put((item, fut))
+        return await fut
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                if not self.queue.empty():
+                    batch.append(self.queue.get_nowait())
+                    continue
+
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await self.flush_slots.acquire()
+            asyncio.ensure_future(self._flush(batch))
+
+    def depth(self):
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _flush(self, batch):
+        # Requests that were cancelled while queued (client gone, deadline passed) are dropped before scoring
+        batch = [(item, fut) for item, fut in batch if not fut.done()]
+        if not batch:
+            self.flush_slots.release()
+            return
+
+        observe_batch_size('batcher', len(batch), **self.labels)
+        try:
+            results = await self.batch_fn([item for item, _ in batch])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+        else:
+            for (_, fut), res in zip(batch, results):
+                if not fut.done():
+                    fut.set_result(res)
+        finally:
+            self.flush_slots.release()
+
+
+def split_balanced(items, num_shards, cost_fn):
+    """
+    Splits `items` into at most `num_shards` contiguous shards of roughly equal total cost, keeping their order.
+    """
+    costs = [cost_fn(x) for x in items]
+    remaining = sum(costs)
+    shards, cur, cur_cost = [], [], 0
+
+    for item, cost in zip(items, costs):
+        # Each shard aims for an equal share of what is left, so early rounding does not pile up in the last one
+        target = remaining / (num_shards - len(shards))
+        if cur and len(shards) < num_shards - 1 and cur_cost + cost / 2 > target:
+            shards.append(cur)
+            remaining -= cur_cost
+            cur, cur_cost = [], 0
+        cur.append(item)
+        cur_cost += cost
+
+    if cur:
+        shards.append(cur)
+    return shards
+
+
+def normalize_sentence(sentence):
+    # Same normalization as the prediction cache keys
+    return ' '.join(sentence.split())
+
+
+def dedupe(items, key_fn):
+    """
+    Returns the first item of each distinct key, and for every item the index of its representative among them.
+    """
+    first, unique, index = {}, [], []
+    for item in items:
+        k = key_fn(item)
+        if k not in first:
+            first[k] = len(unique)
+            unique.append(item)
+        index.append(first[k])
+    return unique, index
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight work. `run` computes only the distinct keys that no other caller is already
+    computing, in one call of the coroutine function `compute_fn`, and awaits the other callers' results for the rest.
+
+    The computation of a batch is shared, so it keeps running while any caller still waits on it and is only
+    cancelled once all of them have been cancelled (e.g. their deadlines passed).
+    """
+
+    def __init__(self):
+        self.in_flight = {}
+        self.waiters = {}
+        self.counters = {'computed': 0, 'coalesced': 0, 'duplicate': 0}
+
+    async def run(self, items, compute_fn, key_fn):
+        unique, index = dedupe(items, key_fn)
+        keys = [key_fn(x) for x in unique]
+        own = [i for i, k in enumerate(keys) if k not in self.in_flight]
+
+        if own:
+            own_keys = [keys[i] for i in own]
+            task = asyncio.ensure_future(compute_fn([unique[i] for i in own]))
+            for pos, k in enumerate(own_keys):
+                self.in_flight[k] = (task, pos)
+            task.add_done_callback(lambda t: self._forget(own_keys, t))
+
+        self.counters['computed'] += len(own)
+        self.counters['coalesced'] += len(unique) - len(own)
+        self.counters['duplicate'] += len(items) - len(unique)
+
+        flights = [self.in_flight[k] for k in keys]
+        tasks = list(dict.fromkeys(task for task, _ in flights))
+        for task in tasks:
+            self.waiters[task] = self.waiters.get(task, 0) + 1
+
+        try:
+            results = dict(zip(tasks, await asyncio.gather(*[asyncio.shield(x) for x in tasks])))
+        finally:
+            for task in tasks:
+                self.waiters[task] -= 1
+                if not self.waiters[task]:
+                    del self.waiters[task]
+                    if not task.done():
+                        # Nobody is left to join a computation that is being cancelled
+                        task.cancel()
+                        self._forget([k for k, (x, _) in self.in_flight.items() if x is task], task)
+
+        unique_results = [results[task][pos] for task, pos in flights]
+        return [unique_results[i] for i in index]
+
+    def _forget(self, keys, task):
+        for k in keys:
+            if self.in_flight.get(k, (None,))[0] is task:
+                del self.in_flight[k]
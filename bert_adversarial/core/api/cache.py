@@ -0,0 +1,137 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from absl import logging
+
+# Older sqlite builds allow at most 999 parameters per statement
+SQLITE_MAX_VARIABLES = 900
+
+
+class PredictionCache:
+    """
+    Two-tier cache of model predictions: a bounded in-memory LRU backed by an optional sqlite database.
+
+    Keys hash the whitespace-normalized sentence together with the identity of the loaded checkpoint, so
+    predictions from different weights never mix. Changing `model_id` drops the in-memory tier, and scores computed
+    for an earlier `model_id` are no longer stored.
+    """
+
+    def __init__(self, model_id, max_size, db_path=None):
+        self.model_id = model_id
+        self.max_size = max_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        self.counters = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0}
+
+        self.db = None
+        self.db_path = db_path
+        self.connect()
+
+    def connect(self):
+        # sqlite connections must not be shared across fork(), so forked workers call this again
+        if self.db_path:
+            self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.db.execute('CREATE TABLE IF NOT EXISTS preds (key TEXT PRIMARY KEY, scores TEXT NOT NULL)')
+            self.db.commit()
+            logging.info('Prediction cache persisted to {}'.format(self.db_path))
+
+    def key(self, sentence, model_id=None):
+        model_id = model_id if model_id is not None else self.model_id
+        return hashlib.sha1('{}\0{}'.format(model_id, ' '.join(sentence.split())).encode('utf-8')).hexdigest()
+
+    def set_model_id(self, model_id):
+        with self.lock:
+            if model_id != self.model_id:
+                logging.info('Model changed from {} to {}, invalidating prediction cache'.format(
+                    self.model_id, model_id))
+                self.model_id = model_id
+                self.memory.clear()
+
+    def lookup(self, sentence_list):
+        """
+        Returns a list with the cached scores of each sentence (None on a miss) and the indices of the misses.
+        """
+        keys = [self.key(x) for x in sentence_list]
+        ret = [None for _ in keys]
+
+        with self.lock:
+            for i, k in enumerate(keys):
+                ret[i] = self.memory.get(k)
+                if ret[i] is not None:
+                    self.memory.move_to_end(k)
+                    self.counters['memory_hits'] += 1
+
+            # Whatever the memory tier missed is read from disk in a few queries, not one per sentence
+            disk_keys = list(set(k for k, scores in zip(keys, ret) if scores is None)) if self.db is not None else []
+            on_disk = {}
+            for start in range(0, len(disk_keys), SQLITE_MAX_VARIABLES):
+                chunk = disk_keys[start:start + SQLITE_MAX_VARIABLES]
+                on_disk.update(self.db.execute('SELECT key, scores FROM preds WHERE key IN ({})'.format(
+                    ','.join('?' for _ in chunk)), chunk).fetchall())
+
+            misses = []
+            for i, k in enumerate(keys):
+                if ret[i] is not None:
+                    continue
+                if k in on_disk:
+                    ret[i] = json.loads(on_disk[k])
+                    self._put_memory(k, ret[i])
+                    self.counters['disk_hits'] += 1
+                else:
+                    self.counters['misses'] += 1
+                    misses.append(i)
+
+        return ret, misses
+
+    def store(self, sentence_list, scores_list, model_id=None):
+        """
+        Stores the scores of each sentence. `model_id` is the identity read before the scores were looked up; if the
+        model was swapped since, they may come from the old weights and are dropped.
+        """
+        with self.lock:
+            if model_id is not None and model_id != self.model_id:
+                return
+            entries = [(self.key(x, model_id), scores) for x, scores in zip(sentence_list, scores_list)]
+            for k, scores in entries:
+                self._put_memory(k, scores)
+            if self.db is not None:
+                self.db.executemany('INSERT OR REPLACE INTO preds (key, scores) VALUES (?, ?)',
+                                    [(k, json.dumps(scores)) for k, scores in entries])
+                self.db.commit()
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters, memory_size=len(self.memory), max_size=self.max_size,
+                        persistent=self.db is not None)
+
+    def _put_memory(self, k, scores):
+        self.memory[k] = scores
+        self.memory.move_to_end(k)
+        while len(self.memory) > self.max_size:
+            self.memory.popitem(last=False)
+            self.counters['evictions'] += 1
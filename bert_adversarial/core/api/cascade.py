@@ -0,0 +1,122 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import json
+import os
+import pickle
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.preprocessing import normalize
+from bert_adversarial.core.utils import transformations as transf
+
+# Same tag set, in the same order, as `svm/svm-train.py`
+SVM_POS = [
+    'MD', 'VBN', 'PRP$', 'CD', 'NNS', 'RBR', 'LS', 'WP', 'JJR', 'RB', 'WP$', 'VBZ', '-LRB-', 'CC', 'JJ',
+    '$', ':', 'VBG', "''", ',', 'WDT', 'EX', 'PDT', 'RP', '``', 'NNPS', 'NNP', 'FW', 'VB', 'PRP', 'RBS',
+    'DT', 'WRB', 'NN', '.', '-NONE-', 'IN', 'TO', 'UH', 'VBD', 'POS', 'VBP', 'JJS', 'SYM', '(', ')'
+]
+
+
+class SVMScorer:
+    """
+    Batched, load-once version of `getCFSScore` in `svm/svm-train.py`. It reads the same vocabulary, idf and
+    LinearSVC files and builds the same `W_P` features (tf-idf words, POS counts and length, sorted by column name).
+    """
+
+    def __init__(self, model_dir, model_name):
+        vocabulary = pd.read_csv(os.path.join(model_dir, 'vocabulary_{}.txt'.format(model_name)))['0']
+        self.count_vect = CountVectorizer(vocabulary=vocabulary)
+        with open(os.path.join(model_dir, 'idf_{}'.format(model_name)), 'rb') as f:
+            self.idf = pickle.load(f)
+        self.clf = joblib.load(os.path.join(model_dir, 'SVM_W_P_{}.pkl'.format(model_name)))
+
+        # Training sorted the feature columns by name, so build each block in place and permute once at the end
+        names = (['W_1_' + str(x) for x in vocabulary] + ['P_1_' + x for x in SVM_POS] + ['length'])
+        self.column_order = np.argsort(names, kind='stable')
+        self.pos_index = {x: i for i, x in enumerate(SVM_POS)}
+
+    def features(self, sentence_list):
+        nltk = transf.require_nltk('punkt', 'averaged_perceptron_tagger')
+        texts = [x.lower() for x in sentence_list]
+
+        words = normalize(self.count_vect.transform(texts).toarray() * self.idf, axis=1, norm='l2')
+        pos = np.zeros((len(texts), len(SVM_POS)))
+        for i, text in enumerate(texts):
+            for _, tag in nltk.pos_tag(nltk.word_tokenize(text)):
+                if tag in self.pos_index:
+                    pos[i, self.pos_index[tag]] += 1
+        length = np.array([[len(x.split())] for x in texts])
+
+        return np.hstack([words, pos, length])[:, self.column_order]
+
+    def margins(self, sentence_list):
+        return self.clf.decision_function(self.features(sentence_list))
+
+    @staticmethod
+    def margins_to_scores(margins):
+        # Matches `LinearSVC._predict_proba_lr` for a binary classifier
+        cfs = 1.0 / (1.0 + np.exp(-np.asarray(margins)))
+        return np.stack([1.0 - cfs, cfs], axis=1)
+
+
+class Cascade:
+    """
+    Screens sentences with the SVM and keeps its verdict whenever the margin falls outside the calibrated
+    `[low, high]` band; only sentences inside the band are left for the transformer.
+    """
+
+    def __init__(self, calibration_loc):
+        with open(calibration_loc) as f:
+            self.calibration = json.load(f)
+        self.low, self.high = self.calibration['low'], self.calibration['high']
+        self.svm = SVMScorer(self.calibration['svm_model_dir'], self.calibration['svm_model_name'])
+
+        self.counters = {'svm': 0, 'bert': 0}
+        self.lock = threading.Lock()
+
+    def identity(self):
+        return 'cascade:{}:{}:{}:{}'.format(self.calibration['svm_model_dir'], self.calibration['svm_model_name'],
+                                            self.low, self.high)
+
+    def screen(self, sentence_list):
+        """
+        Returns a list with the SVM scores of the confident sentences and None elsewhere, plus the indices of the
+        ambiguous sentences that still need the transformer.
+        """
+        margins = self.svm.margins(sentence_list)
+        scores = self.svm.margins_to_scores(margins).tolist()
+
+        ret, ambiguous = [], []
+        for i, (margin, score) in enumerate(zip(margins, scores)):
+            if self.low <= margin <= self.high:
+                ret.append(None)
+                ambiguous.append(i)
+            else:
+                ret.append(score)
+
+        with self.lock:
+            self.counters['bert'] += len(ambiguous)
+            self.counters['svm'] += len(sentence_list) - len(ambiguous)
+        return ret, ambiguous
@@ -0,0 +1,89 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import json
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_TYPES = ['application/msgpack', 'application/x-msgpack']
+FLOAT32_TYPE = 'application/x-claimspotter-float32'
+
+
+def dumps_json(obj):
+    """
+    Encodes a response with orjson when it is installed, which is several times faster than the standard library on
+    long lists of floats and also accepts numpy arrays.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, separators=(',', ':'))
+
+
+def is_msgpack(content_type):
+    return any(x in (content_type or '') for x in MSGPACK_TYPES)
+
+
+def decode_body(content_type, body):
+    """
+    Decodes a request body sent as msgpack or, by default, JSON. Returns None for an empty body.
+    """
+    if not body:
+        return None
+    if is_msgpack(content_type):
+        if msgpack is None:
+            raise ValueError('msgpack request bodies need the `msgpack` package')
+        return msgpack.unpackb(body, raw=False)
+    return orjson.loads(body) if orjson is not None else json.loads(body)
+
+
+def response_format(accept):
+    """
+    Picks the response encoding from an Accept header: `msgpack`, `float32` or the default `json`.
+    """
+    accept = accept or ''
+    if FLOAT32_TYPE in accept:
+        return 'float32'
+    if msgpack is not None and is_msgpack(accept):
+        return 'msgpack'
+    return 'json'
+
+
+def pack_msgpack(obj):
+    # Scores are probabilities, so single precision floats lose nothing that matters and halve their size
+    return msgpack.packb(obj, use_single_float=True)
+
+
+def pack_scores(scores):
+    """
+    Packs an N x 2 list of scores into little-endian float32s, row by row.
+    """
+    return np.asarray(scores, dtype='<f4').reshape(-1, 2).tobytes()
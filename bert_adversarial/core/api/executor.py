@@ -0,0 +1,111 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from absl import logging
+from bert_adversarial.core.utils.cpu import configured_cores, configured_tf_threads, pin_cores, set_tf_threads, \
+    worker_cores
+from bert_adversarial.core.utils.flags import FLAGS
+
+_worker_api = None
+
+
+def process_intra_op_threads(executor_type, num_replicas):
+    # TF has a single intra-op pool per process, shared by all the replicas in it. Only `process` workers each hold a
+    # TF runtime of their own, so only they split the cores between them.
+    if FLAGS.cs_serve_intra_op_threads > 0:
+        return FLAGS.cs_serve_intra_op_threads
+    if executor_type == 'process':
+        return max(1, len(configured_cores()) // max(1, num_replicas))
+    return len(configured_cores())
+
+
+def pin_intra_op_threads(num_threads):
+    # TF only accepts this before its runtime is initialized, so the first caller in a process wins
+    set_tf_threads(num_threads)
+
+
+def pinned_intra_op_threads():
+    return configured_tf_threads()
+
+
+def _init_worker(num_replicas, worker_counter):
+    global _worker_api
+    from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+
+    # Each worker process takes its own slice of cs_cpu_cores, so the replicas do not compete for cores
+    with worker_counter.get_lock():
+        index = worker_counter.value
+        worker_counter.value += 1
+    if FLAGS.cs_cpu_pin:
+        pin_cores(worker_cores(index, num_replicas))
+
+    pin_intra_op_threads(process_intra_op_threads('process', num_replicas))
+    _worker_api = ClaimSpotterAPI(num_replicas=1, executor_type='thread', use_cache=False, doc_workers=0)
+
+
+def _worker_call(method, *args):
+    return getattr(_worker_api, method)(*args)
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+class InferenceExecutor:
+    """
+    Dispatches blocking preprocessing and model calls off the event loop.
+
+    With `executor_type='thread'` calls run on `api` itself, one thread per local model replica. With
+    `executor_type='process'` each worker process owns a private ClaimSpotterAPI holding a single replica.
+    `executor_type='prefork'` runs like `thread`, but the replicas are proxies to the model host process.
+    """
+
+    def __init__(self, api, executor_type, num_replicas):
+        self.api = api
+        self.executor_type = executor_type
+        self.num_replicas = num_replicas
+
+        if executor_type in ['thread', 'prefork']:
+            self.pool = ThreadPoolExecutor(max_workers=num_replicas)
+        else:
+            # Workers are forked before the parent builds any model, so they inherit parsed FLAGS but no TF state
+            ctx = multiprocessing.get_context('fork')
+            self.pool = ProcessPoolExecutor(max_workers=num_replicas, mp_context=ctx, initializer=_init_worker,
+                                            initargs=(num_replicas, ctx.Value('i', 0)))
+            pids = set(f.result() for f in [self.pool.submit(_worker_ready) for _ in range(num_replicas)])
+            logging.info('Started inference worker processes: {}'.format(sorted(pids)))
+
+    def submit(self, method, *args):
+        if self.executor_type != 'process':
+            return self.pool.submit(getattr(self.api, method), *args)
+        return self.pool.submit(_worker_call, method, *args)
+
+    async def run(self, method, *args):
+        return await asyncio.wrap_future(self.submit(method, *args))
+
+    def shutdown(self):
+        self.pool.shutdown(wait=True)
@@ -0,0 +1,235 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import asyncio
+import codecs
+import re
+import time
+from html.parser import HTMLParser
+from bert_adversarial.core.api.metrics import observe_stage, timed_stage
+from bert_adversarial.core.api.segmentation import get_segmenter
+from bert_adversarial.core.utils.flags import FLAGS
+
+# Elements whose text is never article content
+SKIP_TAGS = {'script', 'style', 'noscript', 'template', 'head', 'svg', 'math', 'iframe', 'object', 'canvas',
+             'nav', 'header', 'footer', 'aside', 'button', 'select', 'textarea', 'figure'}
+BLOCK_TAGS = {'address', 'article', 'blockquote', 'body', 'br', 'dd', 'details', 'div', 'dl', 'dt', 'h1', 'h2', 'h3',
+              'h4', 'h5', 'h6', 'hr', 'li', 'main', 'ol', 'p', 'pre', 'section', 'summary', 'table', 'td', 'th', 'tr',
+              'ul'}
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'param', 'source', 'track',
+             'wbr'}
+# Containers too broad to drop because of a class name, e.g. <body class="has-cookie-banner">
+STRUCTURAL_TAGS = {'html', 'body', 'main', 'article'}
+BOILERPLATE_RE = re.compile(r'(^|[-_\s])(nav|navbar|navigation|menu|footer|header|masthead|sidebar|breadcrumbs?|'
+                            r'comments?|share|sharing|social|cookies?|consent|banner|ad|ads|advert|advertisement|'
+                            r'promo|related|recommended|newsletter|subscribe|signup|popup|modal|skip)($|[-_\s])', re.I)
+META_CHARSET_RE = re.compile(br'<meta[^>]+charset\s*=\s*["\']?\s*([-\w.:]+)', re.I)
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+class ContentExtractor(HTMLParser):
+    """
+    Streaming HTML-to-text extraction. Text is grouped into blocks at block-level tags, and text under scripts,
+    navigation, forms and elements whose class or id looks like boilerplate (menus, cookie banners, share bars, ...) is
+    dropped. Of the remaining blocks, only those with at least `min_words` words that are not mostly link text are
+    kept, which removes link lists, bylines and button labels. `feed` returns the blocks completed so far.
+    """
+
+    def __init__(self, min_words=None, max_link_density=0.5):
+        super(ContentExtractor, self).__init__(convert_charrefs=True)
+        self.min_words = min_words if min_words is not None else FLAGS.cs_serve_url_min_block_words
+        self.max_link_density = max_link_density
+
+        # Open elements as (tag, skipped) pairs; skipped also covers elements nested in a skipped one
+        self.stack = []
+        self.link_depth = 0
+        self.parts, self.link_chars = [], 0
+        self.blocks = []
+
+    def feed(self, data):
+        super(ContentExtractor, self).feed(data)
+        ret, self.blocks = self.blocks, []
+        return ret
+
+    def close(self):
+        super(ContentExtractor, self).close()
+        self._end_block()
+        ret, self.blocks = self.blocks, []
+        return ret
+
+    def skipping(self):
+        return bool(self.stack) and self.stack[-1][1]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._end_block()
+        if tag in VOID_TAGS:
+            return
+
+        skipped = self.skipping() or tag in SKIP_TAGS
+        if not skipped and tag not in STRUCTURAL_TAGS:
+            attrs = dict(attrs)
+            marker = '{} {} {}'.format(attrs.get('class') or '', attrs.get('id') or '', attrs.get('role') or '')
+            skipped = BOILERPLATE_RE.search(marker) is not None or attrs.get('aria-hidden') == 'true'
+        self.stack.append((tag, skipped))
+        if tag == 'a':
+            self.link_depth += 1
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in BLOCK_TAGS:
+            self._end_block()
+
+    def handle_endtag(self, tag):
+        # Browsers close unclosed children implicitly; end tags without an open element are ignored
+        if not any(x[0] == tag for x in self.stack):
+            return
+        while self.stack:
+            open_tag, _ = self.stack.pop()
+            if open_tag == 'a':
+                self.link_depth = max(0, self.link_depth - 1)
+            if open_tag == tag:
+                break
+        if tag in BLOCK_TAGS:
+            self._end_block()
+
+    def handle_data(self, data):
+        if self.skipping():
+            return
+        self.parts.append(data)
+        if self.link_depth:
+            self.link_chars += len(data.strip())
+
+    def _end_block(self):
+        text = WHITESPACE_RE.sub(' ', ''.join(self.parts)).strip()
+        link_chars, self.parts, self.link_chars = self.link_chars, [], 0
+
+        if len(text.split()) >= self.min_words and link_chars <= self.max_link_density * len(text):
+            self.blocks.append(text)
+
+
+class PlainTextExtractor:
+    """
+    Same interface as `ContentExtractor` for non-HTML pages: blocks are separated by blank lines.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+
+    def feed(self, data):
+        self.buffer += data.replace('\r', '')
+        *blocks, self.buffer = self.buffer.split('\n\n')
+        return [x for x in (WHITESPACE_RE.sub(' ', b).strip() for b in blocks) if x]
+
+    def close(self):
+        self.buffer += '\n\n'
+        return self.feed('')
+
+
+class PageReader:
+    """
+    Turns a page body that arrives in byte chunks into content text blocks. The charset comes from the Content-Type
+    header, else a byte order mark or a <meta> charset within the first `sniff_bytes`, else UTF-8; undecodable bytes
+    are replaced rather than failing the request.
+    """
+
+    sniff_bytes = 2048
+
+    def __init__(self, content_type=None):
+        content_type = (content_type or 'text/html').lower()
+        self.is_html = 'html' in content_type or 'xml' in content_type
+        self.extractor = ContentExtractor() if self.is_html else PlainTextExtractor()
+
+        match = re.search(r'charset\s*=\s*["\']?([-\w.:]+)', content_type)
+        self.decoder = self._decoder(match.group(1)) if match else None
+        self.head = b''
+
+    @staticmethod
+    def _decoder(charset):
+        try:
+            return codecs.getincrementaldecoder(codecs.lookup(charset).name)(errors='replace')
+        except LookupError:
+            return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def _sniff(self, head):
+        for bom, charset in [(codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'),
+                             (codecs.BOM_UTF16_BE, 'utf-16')]:
+            if head.startswith(bom):
+                return self._decoder(charset)
+        match = META_CHARSET_RE.search(head) if self.is_html else None
+        return self._decoder(match.group(1).decode('ascii') if match else 'utf-8')
+
+    def feed(self, chunk):
+        if self.decoder is None:
+            self.head += chunk
+            if len(self.head) < self.sniff_bytes:
+                return []
+            self.decoder = self._sniff(self.head)
+            chunk, self.head = self.head, b''
+        return self.extractor.feed(self.decoder.decode(chunk))
+
+    def close(self):
+        if self.decoder is None:
+            self.decoder = self._sniff(self.head)
+        text, self.head = self.decoder.decode(self.head, final=True), b''
+        return self.extractor.feed(text) + self.extractor.close()
+
+
+def _parse_chunk(reader, chunk, done, tokenize_sentence):
+    with timed_stage('extract'):
+        blocks = reader.feed(chunk) + (reader.close() if done else [])
+    if not tokenize_sentence:
+        return blocks
+
+    # Segmenting each block separately keeps sentences from running across headings and paragraphs
+    with timed_stage('segment'):
+        return [x for sentences in get_segmenter().segment_batch(blocks) for x in sentences]
+
+
+async def read_page(read, content_type=None, tokenize_sentence=True, max_bytes=None, max_sentences=None):
+    """
+    Reads a page body into the content sentences to score, or into a single text when not `tokenize_sentence`. `read`
+    is a coroutine function returning up to n more bytes, or b'' at the end, like `aiohttp.StreamReader.read`.
+    Reading stops after `max_bytes` bytes, or once `max_sentences` sentences have been found. Each chunk is parsed
+    and segmented on the default executor, so a large page does not hold up the event loop.
+    """
+    loop = asyncio.get_event_loop()
+    max_bytes = max_bytes or FLAGS.cs_serve_url_max_bytes
+    max_sentences = max_sentences or FLAGS.cs_serve_url_max_sentences
+    reader = PageReader(content_type)
+    ret, num_bytes, fetch_time, done = [], 0, 0.0, False
+
+    while not done:
+        start = time.perf_counter()
+        chunk = await read(min(65536, max_bytes - num_bytes))
+        fetch_time += time.perf_counter() - start
+        num_bytes += len(chunk)
+        done = not chunk or num_bytes >= max_bytes
+
+        # Chunks are parsed one at a time, in order, so the reader is never used by two threads at once
+        ret += await loop.run_in_executor(None, _parse_chunk, reader, chunk, done, tokenize_sentence)
+        if tokenize_sentence and len(ret) >= max_sentences:
+            ret = ret[:max_sentences]
+            break
+
+    observe_stage('fetch', fetch_time)
+    return ret if tokenize_sentence else [' '.join(ret)]
@@ -0,0 +1,178 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from absl import logging
+from bert_adversarial.core.api.extraction import read_page
+from bert_adversarial.core.utils.flags import FLAGS
+
+
+class PageCache:
+    """
+    Persistent cache of the pages scored by /score/url, in sqlite.
+
+    For each URL (and sentence tokenization setting) it keeps the ETag and Last-Modified validators and the key of
+    its content, which hashes the extracted sentences together with the extraction settings. For each content key it
+    keeps the sentences, and for each content key and model identity the scores. A page that revalidates with 304 Not
+    Modified is neither extracted nor scored again, and one whose content text is unchanged (even if ads or scripts
+    around it changed) is not scored again. At most `max_pages` URLs are kept, least recently used first out, and
+    content no page refers to any more is dropped with its scores.
+
+    The methods block on sqlite, so callers on the event loop run them with `run_blocking`.
+    """
+
+    schema_version = 2
+
+    def __init__(self, db_path, max_pages):
+        self.db_path = db_path
+        self.max_pages = max_pages
+        self.lock = threading.Lock()
+        self.counters = {'new': 0, 'not_modified': 0, 'unchanged': 0, 'changed': 0, 'score_hits': 0}
+
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        # It is only a cache, so a file written with an older layout is started over
+        if self.db.execute('PRAGMA user_version').fetchone()[0] != self.schema_version:
+            self.db.executescript('DROP TABLE IF EXISTS pages; DROP TABLE IF EXISTS contents; '
+                                  'DROP TABLE IF EXISTS scores; PRAGMA user_version = {};'.format(self.schema_version))
+        self.db.executescript('''
+            CREATE TABLE IF NOT EXISTS pages (url TEXT NOT NULL, tokenize_sentence INTEGER NOT NULL, etag TEXT,
+                                              last_modified TEXT, content_key TEXT NOT NULL, last_used REAL NOT NULL,
+                                              PRIMARY KEY (url, tokenize_sentence));
+            CREATE INDEX IF NOT EXISTS pages_content_key ON pages (content_key);
+            CREATE INDEX IF NOT EXISTS pages_last_used ON pages (last_used);
+            CREATE TABLE IF NOT EXISTS contents (content_key TEXT PRIMARY KEY, sentences TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS scores (content_key TEXT NOT NULL, model_id TEXT NOT NULL,
+                                               scores TEXT NOT NULL, PRIMARY KEY (content_key, model_id));
+        ''')
+        self.db.commit()
+        logging.info('Fetched pages cached in {}'.format(db_path))
+
+    def lookup(self, url, tokenize_sentence):
+        """
+        Returns the (etag, last_modified, content_key) stored for `url` extracted with `tokenize_sentence`, or None.
+        """
+        with self.lock:
+            return self.db.execute('SELECT etag, last_modified, content_key FROM pages WHERE url = ? AND '
+                                   'tokenize_sentence = ?', (url, int(tokenize_sentence))).fetchone()
+
+    def sentences(self, content_key):
+        with self.lock:
+            row = self.db.execute('SELECT sentences FROM contents WHERE content_key = ?', (content_key,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def scores(self, content_key, model_id):
+        with self.lock:
+            row = self.db.execute('SELECT scores FROM scores WHERE content_key = ? AND model_id = ?',
+                                  (content_key, model_id)).fetchone()
+            if row is not None:
+                self.counters['score_hits'] += 1
+        return json.loads(row[0]) if row is not None else None
+
+    def store_page(self, url, tokenize_sentence, etag, last_modified, content_key, sentences):
+        with self.lock:
+            previous = self.db.execute('SELECT content_key FROM pages WHERE url = ? AND tokenize_sentence = ?',
+                                       (url, int(tokenize_sentence))).fetchone()
+            self.db.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                            (url, int(tokenize_sentence), etag, last_modified, content_key, time.time()))
+            self.db.execute('INSERT OR IGNORE INTO contents VALUES (?, ?)', (content_key, json.dumps(sentences)))
+
+            evicted = self.db.execute('DELETE FROM pages WHERE rowid IN (SELECT rowid FROM pages ORDER BY last_used '
+                                      'DESC LIMIT -1 OFFSET ?)', (self.max_pages,)).rowcount
+            if evicted:
+                self.db.execute('DELETE FROM contents WHERE content_key NOT IN (SELECT content_key FROM pages)')
+                self.db.execute('DELETE FROM scores WHERE content_key NOT IN (SELECT content_key FROM pages)')
+            elif previous is not None and previous[0] != content_key:
+                # The page changed: its old content goes unless another page has the same content
+                self._drop_if_unused(previous[0])
+            self.db.commit()
+
+    def _drop_if_unused(self, content_key):
+        if self.db.execute('SELECT 1 FROM pages WHERE content_key = ? LIMIT 1', (content_key,)).fetchone() is None:
+            self.db.execute('DELETE FROM contents WHERE content_key = ?', (content_key,))
+            self.db.execute('DELETE FROM scores WHERE content_key = ?', (content_key,))
+
+    def touch(self, url, tokenize_sentence):
+        with self.lock:
+            self.db.execute('UPDATE pages SET last_used = ? WHERE url = ? AND tokenize_sentence = ?',
+                            (time.time(), url, int(tokenize_sentence)))
+            self.db.commit()
+
+    def store_scores(self, content_key, model_id, scores):
+        with self.lock:
+            # The page may have changed (or been evicted) while it was scored; scores of dropped content are not kept
+            self.db.execute('INSERT OR REPLACE INTO scores SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM contents WHERE '
+                            'content_key = ?)', (content_key, model_id, json.dumps(scores), content_key))
+            self.db.commit()
+
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_event_loop().run_in_executor(None, fn, *args)
+
+
+def content_key(sentences, tokenize_sentence):
+    # Other extraction settings could yield other sentences from the same page later on, so they are part of the key
+    return hashlib.sha1(json.dumps([tokenize_sentence, FLAGS.cs_serve_url_max_bytes, FLAGS.cs_serve_url_max_sentences,
+                                    FLAGS.cs_serve_url_min_block_words, sentences]).encode('utf-8')).hexdigest()
+
+
+async def fetch_sentences(session, url, page_cache=None, tokenize_sentence=True, revalidate=True):
+    """
+    Downloads and extracts the page at `url` with the aiohttp `session`. With a `page_cache`, the request carries the
+    stored validators (unless not `revalidate`) and the stored sentences are reused when the server answers 304.
+    Returns the content key of the page and its sentences.
+    """
+    cached = None
+    if page_cache is not None and revalidate:
+        cached = await run_blocking(page_cache.lookup, url, tokenize_sentence)
+    headers = {}
+    if cached is not None:
+        if cached[0]:
+            headers['If-None-Match'] = cached[0]
+        if cached[1]:
+            headers['If-Modified-Since'] = cached[1]
+
+    async with session.get(url, headers=headers) as resp:
+        if cached is not None and resp.status == 304:
+            sentences = await run_blocking(page_cache.sentences, cached[2])
+            if sentences is not None:
+                page_cache.counters['not_modified'] += 1
+                await run_blocking(page_cache.touch, url, tokenize_sentence)
+                return cached[2], sentences
+            # Stored validators without stored sentences: the page must be downloaded again
+            return await fetch_sentences(session, url, page_cache, tokenize_sentence, revalidate=False)
+
+        sentences = await read_page(resp.content.read, resp.headers.get('Content-Type'), tokenize_sentence)
+        key = content_key(sentences, tokenize_sentence)
+
+        if page_cache is not None and resp.status == 200 and \
+                'no-store' not in resp.headers.get('Cache-Control', '').lower():
+            page_cache.counters['new' if cached is None else 'unchanged' if cached[2] == key else 'changed'] += 1
+            await run_blocking(page_cache.store_page, url, tokenize_sentence, resp.headers.get('ETag'),
+                               resp.headers.get('Last-Modified'), key, sentences)
+
+    return key, sentences
@@ -0,0 +1,154 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from bert_adversarial.core.utils.flags import FLAGS
+
+
+class Summary:
+    """
+    Count, sum and sliding-window quantiles of an observed value. `observe` only appends to a bounded deque and bumps
+    two numbers under a lock, so it is cheap enough for the hot path; quantiles are only computed when scraped.
+    """
+
+    quantiles = (0.5, 0.95, 0.99)
+
+    def __init__(self, window=None):
+        self.window = deque(maxlen=window or FLAGS.cs_serve_metrics_window)
+        self.count = 0
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        with self.lock:
+            self.window.append(value)
+            self.count += 1
+            self.total += value
+
+    def snapshot(self):
+        with self.lock:
+            window = sorted(self.window)
+            count, total = self.count, self.total
+
+        qs = [(q, window[min(len(window) - 1, int(q * len(window)))] if window else float('nan'))
+              for q in self.quantiles]
+        return qs, count, total
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.summaries = {}
+        self.callbacks = {}
+        self.help = {}
+        self.lock = threading.Lock()
+
+    def summary(self, name, help_text, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        ret = self.summaries.get(key)
+        if ret is None:
+            with self.lock:
+                ret = self.summaries.setdefault(key, Summary())
+                self.help[name] = help_text
+        return ret
+
+    def register_callback(self, name, help_text, fn, metric_type='gauge'):
+        """
+        Registers a value read at scrape time. `fn` returns either a number or a dict of {label value tuple: number}
+        keyed the same way as `labels` on `summary`, e.g. {(('kind', 'memory'),): 3}.
+        """
+        with self.lock:
+            self.callbacks[name] = (fn, metric_type)
+            self.help[name] = help_text
+
+    def observe(self, name, help_text, value, **labels):
+        self.summary(name, help_text, **labels).observe(value)
+
+    @contextmanager
+    def timed(self, name, help_text, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.summary(name, help_text, **labels).observe(time.perf_counter() - start)
+
+    def render(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            summaries = sorted(self.summaries.items())
+            callbacks = sorted(self.callbacks.items())
+
+        last_name = None
+        for (name, labels), summary in summaries:
+            if name != last_name:
+                lines += ['# HELP {} {}'.format(name, self.help[name]), '# TYPE {} summary'.format(name)]
+                last_name = name
+
+            qs, count, total = summary.snapshot()
+            for q, v in qs:
+                lines.append('{}{} {}'.format(name, format_labels(labels + (('quantile', str(q)),)), v))
+            lines.append('{}_sum{} {}'.format(name, format_labels(labels), total))
+            lines.append('{}_count{} {}'.format(name, format_labels(labels), count))
+
+        for name, (fn, metric_type) in callbacks:
+            lines += ['# HELP {} {}'.format(name, self.help[name]), '# TYPE {} {}'.format(name, metric_type)]
+            values = fn()
+            if not isinstance(values, dict):
+                values = {(): values}
+            for labels, v in sorted(values.items()):
+                lines.append('{}{} {}'.format(name, format_labels(labels), float(v)))
+
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in labels) + '}'
+
+
+REGISTRY = MetricsRegistry()
+
+
+def model_labels(model):
+    # Stages of the page fetch happen before any model is picked, so they carry no `model` label
+    return {'model': model} if model is not None else {}
+
+
+def timed_stage(stage, model=None):
+    return REGISTRY.timed('claimspotter_stage_seconds', 'Time spent in each scoring stage', stage=stage,
+                          **model_labels(model))
+
+
+def observe_stage(stage, seconds, model=None):
+    REGISTRY.observe('claimspotter_stage_seconds', 'Time spent in each scoring stage', seconds, stage=stage,
+                     **model_labels(model))
+
+
+def observe_batch_size(kind, size, model=None):
+    REGISTRY.observe('claimspotter_batch_size', 'Number of sentences per batch', size, kind=kind,
+                     **model_labels(model))
@@ -0,0 +1,228 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import mmap
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import numpy as np
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+
+ALIGNMENT = 64
+
+
+class SharedBatchSlot:
+    """
+    A block of anonymous shared memory mapped before the HTTP workers fork, so the worker and the model host see the
+    same pages. Arrays are written into it back to back and read out as numpy views over it, so only a small header
+    of shapes and dtypes goes over the pipe instead of the pickled arrays.
+
+    Each worker link has at most one batch in flight (its proxy is checked out like any other replica), so a link
+    needs one slot. The request arrays and then the probabilities use the same memory in turn.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buf = mmap.mmap(-1, capacity)
+
+    def write(self, arrays):
+        """
+        Copies `arrays` into the slot and returns their header, or None if they do not fit.
+        """
+        arrays = [np.ascontiguousarray(x) for x in arrays]
+        header, offset = [], 0
+        for x in arrays:
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            header.append((offset, x.shape, x.dtype.str))
+            offset += x.nbytes
+        if offset > self.capacity:
+            return None
+
+        for (offset, shape, dtype), x in zip(header, arrays):
+            np.copyto(np.ndarray(shape, dtype=dtype, buffer=self.buf, offset=offset), x)
+        return header
+
+    def read(self, header):
+        """
+        Returns views over the arrays described by `header`. They are only valid until the slot is written again.
+        """
+        return [np.ndarray(shape, dtype=dtype, buffer=self.buf, offset=offset) for offset, shape, dtype in header]
+
+    def close(self):
+        self.buf.close()
+
+
+class ModelHostError(RuntimeError):
+    """
+    The model host failed to score a batch sent by an HTTP worker.
+    """
+
+
+class RemotePredictor:
+    """
+    Stands in for a local model replica inside an HTTP worker: padded feature batches are sent to the model
+    host and the class probabilities come back as a numpy array. With a SharedBatchSlot, the arrays travel
+    through shared memory and the pipe only carries their header; batches too large for the slot are pickled.
+    """
+
+    def __init__(self, conn, slot=None):
+        self.conn = conn
+        self.slot = slot
+
+    def preds_on_batch(self, x):
+        header = self.slot.write(x) if self.slot is not None else None
+        self.conn.send(('shm', header) if header is not None else ('pipe', x))
+
+        transport, ret = self.conn.recv()
+        if transport == 'error':
+            raise ModelHostError(ret)
+        # A view into the slot: callers convert it before the replica is checked out for another batch
+        return self.slot.read(ret)[0] if transport == 'shm' else ret
+
+
+class ModelHost:
+    """
+    Owns the only copy of the model weights. Runs in the parent process after the HTTP workers have been forked,
+    so TensorFlow is never initialized before a fork. One thread serves each worker pipe.
+    """
+
+    def __init__(self, num_replicas):
+        from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+
+        self.api = ClaimSpotterAPI(num_replicas=num_replicas, executor_type='thread', use_cache=False, use_cascade=False,
+                                    doc_workers=0)
+
+    def serve(self, conns, slots=None):
+        slots = slots or [None for _ in conns]
+        threads = [threading.Thread(target=self._serve_conn, args=(conn, slot), daemon=True)
+                   for conn, slot in zip(conns, slots)]
+        for t in threads:
+            t.start()
+        return threads
+
+    def _serve_conn(self, conn, slot=None):
+        while True:
+            try:
+                transport, x = conn.recv()
+            except EOFError:
+                return
+
+            try:
+                if transport == 'shm':
+                    x = tuple(slot.read(x))
+                preds = self.api.preds_on_batch(x)
+            except Exception as e:
+                # The worker is waiting for an answer, so the failure goes back to it instead of ending this link
+                logging.exception('Model host failed to score a batch')
+                reply = ('error', repr(e))
+            else:
+                # The model is done with the request arrays, so the probabilities can overwrite them
+                header = slot.write([preds]) if transport == 'shm' else None
+                reply = ('shm', header) if header is not None else ('pipe', preds)
+
+            try:
+                conn.send(reply)
+            except (BrokenPipeError, EOFError, OSError):
+                return
+
+
+def slot_capacity(api):
+    # Room for the largest padded batch (cs_batch_size_reg rows of max_len int32 ids) plus its sentiment features
+    return FLAGS.cs_batch_size_reg * (api.max_len + 16) * 4 + 4 * ALIGNMENT
+
+
+def serve_prefork(app, api, host, port, num_workers):
+    """
+    Binds `host:port` once and forks `num_workers` HTTP workers that share the listening socket. Workers only
+    hold the tokenizer and preprocessing dependencies (inherited copy-on-write); inference runs in the parent.
+    """
+    num_workers = num_workers or os.cpu_count() or 1
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    sock.set_inheritable(True)
+
+    links = [[multiprocessing.Pipe() for _ in range(api.num_replicas)] for _ in range(num_workers)]
+    slots = [[SharedBatchSlot(slot_capacity(api)) if FLAGS.cs_serve_ipc == 'shm' else None
+              for _ in range(api.num_replicas)] for _ in range(num_workers)]
+    pids = []
+
+    for worker_links, worker_slots in zip(links, slots):
+        pid = os.fork()
+        if pid == 0:
+            api.attach_remote_predictors([RemotePredictor(child_conn, slot)
+                                          for (_, child_conn), slot in zip(worker_links, worker_slots)])
+            app.run(sock=sock, workers=1)
+            os._exit(0)
+        pids.append(pid)
+
+    for worker_links in links:
+        for _, child_conn in worker_links:
+            child_conn.close()
+
+    logging.info('Forked {} HTTP workers: {}'.format(num_workers, pids))
+
+    # Stopped with SIGTERM (by a process manager, say) the host tears down like on Ctrl-C
+    def on_sigterm(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, on_sigterm)
+
+    parent_conns = [parent_conn for worker_links in links for parent_conn, _ in worker_links]
+    all_slots = [slot for worker_slots in slots for slot in worker_slots]
+    threads = []
+    try:
+        model_host = ModelHost(api.num_replicas)
+        threads = model_host.serve(parent_conns, all_slots)
+        for pid in pids:
+            os.waitpid(pid, 0)
+    except (KeyboardInterrupt, SystemExit):
+        logging.info('Stopping HTTP workers: {}'.format(pids))
+    finally:
+        _stop_workers(pids)
+        # With the workers gone the host threads read EOF and return; only then can the memory under them be unmapped
+        for t in threads:
+            t.join(timeout=5)
+        for conn in parent_conns:
+            conn.close()
+        if not any(t.is_alive() for t in threads):
+            for slot in all_slots:
+                if slot is not None:
+                    slot.close()
+
+
+def _stop_workers(pids):
+    for pid in pids:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in pids:
+        try:
+            os.waitpid(pid, 0)
+        except ChildProcessError:
+            pass
@@ -0,0 +1,203 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+
+import asyncio
+import os
+from abc import ABC, abstractmethod
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tensorflow as tf
+from bert_adversarial.core.api.admission import AdmissionController
+from bert_adversarial.core.api.api_wrapper import ClaimSpotterAPI
+from bert_adversarial.core.api.batcher import MicroBatcher, split_by_token_budget
+from bert_adversarial.core.api.cascade import SVMScorer
+from bert_adversarial.core.api.metrics import REGISTRY, timed_stage
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+
+DEFAULT_MODEL = 'default'
+MODEL_KINDS = ['transformer', 'svm', 'bilstm']
+
+
+def parse_model_spec(spec):
+    """
+    Splits a `name=kind:path` entry of --cs_serve_models.
+    """
+    name, sep, rest = spec.partition('=')
+    kind, sep2, path = rest.partition(':')
+    if not (sep and sep2 and name and path) or kind not in MODEL_KINDS:
+        raise ValueError('Invalid --cs_serve_models entry `{}`, expected name=kind:path with kind one of {}'.format(
+            spec, MODEL_KINDS))
+    return name, kind, path
+
+
+class LocalScorer(ABC):
+    """
+    Base for the non-transformer models. `batch_sentence_query` runs on one worker thread off the event loop, and the
+    rest of the ClaimSpotterAPI interface used by the server, the micro-batcher and admission control is filled in.
+    """
+
+    name = None
+    num_replicas = 1
+    cache = None
+    # Inputs longer than this cost no more when sharding documents; models that truncate set their own length
+    max_len = FLAGS.cs_max_len
+    estimate_token_count = ClaimSpotterAPI.estimate_token_count
+
+    def __init__(self, model_identity):
+        self.return_strings = ['Non-factual sentence', 'Check-worthy factual statement']
+        self.model_identity = model_identity
+        self.sec_per_sentence = 0.0
+        self.pool = ThreadPoolExecutor(max_workers=1)
+
+    @abstractmethod
+    def batch_sentence_query(self, sentence_list):
+        """
+        Returns the scores of each sentence, as [non-factual, check-worthy] probabilities.
+        """
+
+    def _timed_query(self, sentence_list):
+        start = time.perf_counter()
+        ret = self.batch_sentence_query(sentence_list)
+        if sentence_list:
+            self.sec_per_sentence += 0.2 * ((time.perf_counter() - start) / len(sentence_list) - self.sec_per_sentence)
+        return ret
+
+    async def async_batch_sentence_query(self, sentence_list):
+        sentence_list = [x.strip('\n\r\t ') for x in sentence_list]
+        return await asyncio.wrap_future(self.pool.submit(self._timed_query, sentence_list))
+
+    async def async_document_query(self, sentence_list, token_budget=None):
+        batches = split_by_token_budget(sentence_list, token_budget or FLAGS.cs_serve_token_budget,
+                                        self.estimate_token_count)
+        results = await asyncio.gather(*[self.async_batch_sentence_query(x) for x in batches])
+        return [scores for batch in results for scores in batch]
+
+    def degraded_query(self, sentence_list, mode):
+        # These models are already the cheap fallback, so there is nothing to degrade to
+        return None
+
+
+class SVMModel(LocalScorer):
+    """
+    The LinearSVC written by `svm/svm-train.py`, loaded from `<model_dir>/<training file name>`.
+    """
+
+    def __init__(self, loc):
+        super(SVMModel, self).__init__('svm:{}'.format(os.path.abspath(loc)))
+        self.svm = SVMScorer(*os.path.split(loc))
+
+    def batch_sentence_query(self, sentence_list):
+        with timed_stage('svm', self.name):
+            return self.svm.margins_to_scores(self.svm.margins(sentence_list)).tolist()
+
+
+class BiLSTMModel(LocalScorer):
+    """
+    The `.h5` model written by `bidirectional_lstm/bilstm-train.py`, with the Keras tokenizer it saved alongside.
+    """
+
+    def __init__(self, loc):
+        super(BiLSTMModel, self).__init__('bilstm:{}'.format(os.path.abspath(loc)))
+        self.model = tf.keras.models.load_model(loc, compile=False)
+        with open(self.tokenizer_file(loc)) as f:
+            self.tokenizer = tf.keras.preprocessing.text.tokenizer_from_json(f.read())
+        self.max_len = self.model.input_shape[1] or 500
+
+    @staticmethod
+    def tokenizer_file(model_loc):
+        return os.path.splitext(model_loc)[0] + '_tokenizer.json'
+
+    def batch_sentence_query(self, sentence_list):
+        with timed_stage('tokenize', self.name):
+            x = tf.keras.preprocessing.sequence.pad_sequences(self.tokenizer.texts_to_sequences(sentence_list),
+                                                              maxlen=self.max_len)
+        ret = []
+        for start in range(0, len(x), FLAGS.cs_batch_size_reg):
+            with timed_stage('model', self.name):
+                ret += np.asarray(self.model.predict_on_batch(x[start:start + FLAGS.cs_batch_size_reg])).tolist()
+        return ret
+
+
+def build_model(kind, loc):
+    if kind == 'transformer':
+        # Extra transformers are SavedModel exports, which carry their own architecture, vocabulary and max length
+        return ClaimSpotterAPI(num_replicas=1, executor_type='thread', use_cascade=False, doc_workers=0,
+                               saved_model_dir=loc)
+    if kind == 'svm':
+        return SVMModel(loc)
+    return BiLSTMModel(loc)
+
+
+class ServedModel:
+    """
+    One named model with its own micro-batcher and admission control, so a slow model cannot hold up the others.
+    """
+
+    def __init__(self, name, kind, api):
+        self.name = name
+        self.kind = kind
+        self.api = api
+        self.api.name = name
+        self.batcher = MicroBatcher(self.score_batch, max_concurrency=api.num_replicas, labels={'model': name})
+        self.admission = AdmissionController(api)
+
+    async def score_batch(self, sentences):
+        with REGISTRY.timed('claimspotter_model_batch_seconds', 'Time to score one micro-batch', model=self.name):
+            return await self.api.async_batch_sentence_query(sentences)
+
+
+class ModelRegistry:
+    """
+    The models served by this process: `api` under the name `default`, plus each `name=kind:path` entry of
+    --cs_serve_models. Requests pick one with their `model` parameter.
+    """
+
+    def __init__(self, api, specs=None):
+        self.models = OrderedDict([(DEFAULT_MODEL, ServedModel(DEFAULT_MODEL, 'transformer', api))])
+
+        for spec in (specs if specs is not None else FLAGS.cs_serve_models):
+            name, kind, loc = parse_model_spec(spec)
+            if name in self.models:
+                raise ValueError('Model name `{}` is used twice'.format(name))
+            logging.info('Loading {} model `{}` from {}'.format(kind, name, loc))
+            self.models[name] = ServedModel(name, kind, build_model(kind, loc))
+
+    def get(self, name=None):
+        return self.models[name or DEFAULT_MODEL]
+
+    def __iter__(self):
+        return iter(self.models.values())
+
+    def start(self):
+        for model in self:
+            model.batcher.start()
+
+    async def stop(self):
+        for model in self:
+            await model.batcher.stop()
+
+    def describe(self):
+        return {model.name: {'kind': model.kind, 'identity': model.api.model_identity} for model in self}
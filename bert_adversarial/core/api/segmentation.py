@@ -0,0 +1,144 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import threading
+from collections import namedtuple
+from bert_adversarial.core.utils import transformations as transf
+from bert_adversarial.core.utils.flags import FLAGS
+
+# `start` and `end` are character offsets into the whole text fed to the segmenter (or stream)
+Sentence = namedtuple('Sentence', ['start', 'end', 'text'])
+
+
+def load_punkt(language='english'):
+    """
+    Returns the Punkt sentence tokenizer behind `nltk.sent_tokenize`, from `punkt_tab` on NLTK 3.8.2+ or from the
+    `punkt` pickle on older releases.
+    """
+    nltk = transf.require_nltk('punkt')
+    try:
+        from nltk.tokenize.punkt import PunktTokenizer
+        return PunktTokenizer(language)
+    except (ImportError, LookupError):
+        return nltk.data.load('tokenizers/punkt/{}.pickle'.format(language))
+
+
+class SentenceSegmenter:
+    """
+    Splits text into sentences like `transformations.sentence_tokenize`, with the Punkt model loaded once and kept warm
+    instead of looked up on every call. Sentences come with their character offsets, and text that arrives in chunks
+    is segmented incrementally with `stream` or `iter_sentences`.
+    """
+
+    def __init__(self, language='english'):
+        self.punkt = load_punkt(language)
+        self.end_chars = tuple(self.punkt._lang_vars.sent_end_chars)
+
+    def spans(self, text):
+        return list(self.punkt.span_tokenize(text))
+
+    def segment(self, text):
+        return [text[start:end] for start, end in self.punkt.span_tokenize(text)]
+
+    def segment_batch(self, texts):
+        return [self.segment(x) for x in texts]
+
+    def stream(self, max_buffer=None):
+        return SegmentStream(self, max_buffer)
+
+    def iter_sentences(self, chunks, max_buffer=None):
+        """
+        Yields a Sentence for each sentence in the text chunks of the iterable `chunks`, as soon as the following
+        text shows it is complete.
+        """
+        stream = self.stream(max_buffer)
+        for chunk in chunks:
+            yield from stream.feed(chunk)
+        yield from stream.close()
+
+
+class SegmentStream:
+    """
+    Incremental state of a SentenceSegmenter. Only the trailing, possibly unfinished sentence is kept between chunks,
+    and it is force-split once it exceeds `max_buffer` characters, so memory stays bounded.
+    """
+
+    def __init__(self, segmenter, max_buffer=None):
+        self.segmenter = segmenter
+        self.max_buffer = max_buffer or FLAGS.cs_serve_stream_max_buffer
+        # Offset of the buffer's first character in the whole stream
+        self.buffer, self.offset = '', 0
+
+    def feed(self, text):
+        self.buffer += text
+        ret = []
+
+        # Punkt cannot find a boundary before a sentence-ending character arrives, e.g. while a long sentence is being
+        # streamed a few words at a time
+        spans = self.segmenter.spans(self.buffer) if any(c in self.buffer for c in self.segmenter.end_chars) else []
+        if spans:
+            # The last sentence may still continue in the next chunk, or be merged with it (e.g. after an
+            # abbreviation). It keeps its trailing whitespace, so a word boundary at the end of this chunk is not lost.
+            ret = [self._sentence(start, end) for start, end in spans[:-1]]
+            self._advance(spans[-1][0])
+        while len(self.buffer) > self.max_buffer:
+            # A forced split can fall anywhere, so its piece may start or end with whitespace
+            text = self.buffer[:self.max_buffer]
+            start = len(text) - len(text.lstrip())
+            ret.append(self._sentence(start, start + len(text.strip())))
+            self._advance(self.max_buffer)
+
+        return [x for x in ret if x.text]
+
+    def close(self):
+        # Whatever `feed` kept is a single sentence, the last one Punkt found or text it has not split yet
+        ret = self._sentence(0, len(self.buffer.rstrip()))
+        self._advance(len(self.buffer))
+        return [ret] if ret.text else []
+
+    def _sentence(self, start, end):
+        # Offsets point at the stripped text and count carriage returns, the text drops them. Punkt only leaves
+        # whitespace at the very start of its input.
+        text = self.buffer[start:end]
+        if text[:1].isspace():
+            stripped = text.lstrip()
+            start, text = start + len(text) - len(stripped), stripped
+        return Sentence(self.offset + start, self.offset + end, text.replace('\r', '') if '\r' in text else text)
+
+    def _advance(self, n):
+        self.buffer, self.offset = self.buffer[n:], self.offset + n
+
+
+_segmenter = None
+_segmenter_lock = threading.Lock()
+
+
+def get_segmenter():
+    """
+    Returns the process-wide SentenceSegmenter. Punkt tokenizers keep no state between calls, so it is shared by the
+    URL and streaming paths across threads.
+    """
+    global _segmenter
+    with _segmenter_lock:
+        if _segmenter is None:
+            _segmenter = SentenceSegmenter()
+        return _segmenter
@@ -0,0 +1,158 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import asyncio
+import json
+from collections import deque
+from numpy import argmax
+from bert_adversarial.core.api.segmentation import get_segmenter
+from bert_adversarial.core.utils.flags import FLAGS
+
+
+class IncrementalSegmenter:
+    """
+    Splits text that arrives in arbitrary chunks into sentences, on the shared warm segmenter. See SegmentStream.
+    """
+
+    def __init__(self, max_buffer=None):
+        self.stream = get_segmenter().stream(max_buffer)
+
+    def feed(self, text):
+        return [x.text for x in self.stream.feed(text)]
+
+    def close(self):
+        return [x.text for x in self.stream.close()]
+
+
+class StreamScorer:
+    """
+    Scores sentences from an incremental source in rolling token-budgeted batches. Up to `max_in_flight` batches are
+    scored concurrently and results are emitted in document order as soon as the oldest batch finishes.
+    """
+
+    def __init__(self, api, emit, token_budget=None, max_in_flight=None):
+        self.api = api
+        self.emit = emit
+        self.token_budget = token_budget or FLAGS.cs_serve_token_budget
+        self.max_in_flight = max_in_flight or self.api.num_replicas
+
+        self.pending, self.pending_cost = [], 0
+        self.in_flight = deque()
+        self.num_emitted = 0
+
+    async def add(self, sentences):
+        for sentence in sentences:
+            cost = self.api.estimate_token_count(sentence)
+            if self.pending and self.pending_cost + cost > self.token_budget:
+                await self._submit()
+            self.pending.append(sentence)
+            self.pending_cost += cost
+
+        # Scores whatever is complete now, so a slow input stream still gets its results promptly
+        if self.pending:
+            await self._submit()
+        await self._drain(block=False)
+
+    async def finish(self):
+        if self.pending:
+            await self._submit()
+        await self._drain(block=True)
+
+    async def _submit(self):
+        batch, self.pending, self.pending_cost = self.pending, [], 0
+        self.in_flight.append((batch, asyncio.ensure_future(self.api.async_batch_sentence_query(batch))))
+        while len(self.in_flight) > self.max_in_flight:
+            await self._emit_oldest()
+
+    async def _drain(self, block):
+        while self.in_flight and (block or self.in_flight[0][1].done()):
+            await self._emit_oldest()
+
+    async def _emit_oldest(self):
+        batch, task = self.in_flight.popleft()
+        for sentence, scores in zip(batch, await task):
+            await self.emit({'index': self.num_emitted, 'claim': sentence,
+                             'result': self.api.return_strings[argmax(scores)], 'scores': [scores]})
+            self.num_emitted += 1
+
+    def cancel(self):
+        for _, task in self.in_flight:
+            task.cancel()
+        self.in_flight.clear()
+
+
+class NdjsonParser:
+    """
+    Splits NDJSON that arrives in arbitrary byte chunks into lines. Each line is either a JSON string or an object with
+    a `text` field. Invalid lines are skipped and reported as `{"error": ..., "line": n}` events (1-based), and so is a
+    line longer than `max_line` bytes, which is dropped up to its newline instead of being buffered, so memory stays
+    bounded.
+    """
+
+    def __init__(self, max_line=None):
+        self.max_line = max_line or FLAGS.cs_serve_stream_max_buffer
+        self.rest = b''
+        self.num_lines = 0
+        self.skipping = False
+
+    def feed(self, chunk):
+        """
+        Returns the text of the lines completed by `chunk`, joined with spaces, and the error events for bad lines.
+        """
+        *lines, rest = (self.rest + chunk).split(b'\n')
+        texts, errors = [], []
+        for line in lines:
+            self.num_lines += 1
+            if self.skipping:
+                self.skipping = False
+                continue
+            self._parse(line, texts, errors)
+
+        self.rest = rest
+        if len(self.rest) > self.max_line:
+            if not self.skipping:
+                errors.append({'error': 'Line longer than {} bytes'.format(self.max_line), 'line': self.num_lines + 1})
+            self.rest, self.skipping = b'', True
+        return ''.join(texts), errors
+
+    def close(self):
+        text, errors = self.feed(b'\n') if self.rest or self.skipping else ('', [])
+        self.rest, self.skipping = b'', False
+        return text, errors
+
+    def _parse(self, line, texts, errors):
+        if not line.strip():
+            return
+        try:
+            obj = json.loads(line)
+            text = obj if isinstance(obj, str) else obj.get('text', '') if isinstance(obj, dict) else None
+            if not isinstance(text, str):
+                raise ValueError('expected a JSON string or an object with a string `text` field')
+        except ValueError as e:
+            errors.append({'error': 'Invalid NDJSON line: {}'.format(e), 'line': self.num_lines})
+            return
+        texts.append(text + ' ')
+
+
+def format_event(obj, sse=False):
+    data = json.dumps(obj)
+    return 'data: {}\n\n'.format(data) if sse else data + '\n'
@@ -118,6 +118,8 @@ class AdvBertEmbeddingsLayer(BertEmbeddingsLayer):
         assert self.position_embeddings_layer is not None
         if self.position_embeddings_layer is not None:
             seq_len = input_ids.shape.as_list()[1]
+            if seq_len is None:
+                seq_len = tf.shape(input_ids)[1]
             emb_size = embedding_output.shape[-1]
 
             pos_embeddings = self.position_embeddings_layer(seq_len)
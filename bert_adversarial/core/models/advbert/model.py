@@ -56,6 +56,14 @@ class AdvBertModelLayer(BertModelLayer):
 
         super(BertModelLayer, self).build(input_shape)
 
+    def relax_input_specs(self):
+        # Sub-layers record the full warm-up shape as their input spec; keep only the rank so that
+        # inference can feed batches padded to shorter lengths through the same weights
+        for layer in [self] + [x for x in self.submodules if isinstance(x, tf.keras.layers.Layer)]:
+            if layer.input_spec is not None:
+                layer.input_spec = tf.nest.map_structure(lambda spec: tf.keras.layers.InputSpec(ndim=spec.ndim),
+                                                         layer.input_spec)
+
     def call(self, inputs, perturb=None, get_embedding=-1, mask=None, training=None):
         if mask is None:
             mask = self.embeddings_layer.compute_mask(inputs)
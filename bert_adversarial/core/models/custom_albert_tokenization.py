@@ -27,9 +27,9 @@ from bert_adversarial.core.utils.flags import FLAGS
 
 
 class CustomAlbertTokenizer:
-    def __init__(self):
+    def __init__(self, model_file=None):
         self.model = spm.SentencePieceProcessor()
-        self.model.load(os.path.join(FLAGS.cs_model_loc, "30k-clean.model"))
+        self.model.load(model_file or os.path.join(FLAGS.cs_model_loc, "30k-clean.model"))
 
     def tokenize_array(self, inp):
         return [encode_ids(self.model, preprocess_text(x, lower=True)) for x in inp]
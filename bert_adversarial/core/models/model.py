@@ -21,6 +21,8 @@
 #
 import os
 import re
+from collections import Counter
+import numpy as np
 import tensorflow as tf
 import json
 from bert_adversarial.core.utils.flags import FLAGS
@@ -44,7 +46,8 @@ class ClaimSpotterModel(tf.keras.models.Model):
 
         self.layer.call((input_ph_id, input_ph_sent), training=False)
 
-    def load_custom_model(self, loc=None):
+    @staticmethod
+    def resolve_checkpoint(loc=None):
         model_dir = (loc if loc is not None else FLAGS.cs_model_dir)
 
         if any('.ckpt' in x for x in os.listdir(model_dir)):
@@ -56,11 +59,46 @@ class ClaimSpotterModel(tf.keras.models.Model):
         last_epoch = int(load_location.split('/')[-1].split('_')[-1])
         load_location = os.path.join(load_location, FLAGS.cs_model_ckpt)
 
+        return load_location, last_epoch
+
+    @staticmethod
+    def checkpoint_identity(loc=None):
+        load_location, _ = ClaimSpotterModel.resolve_checkpoint(loc)
+        index_file = load_location + '.index'
+        mtime = os.path.getmtime(index_file) if os.path.isfile(index_file) else 0
+
+        return '{}@{}'.format(os.path.abspath(load_location), mtime)
+
+    def load_custom_model(self, loc=None):
+        load_location, last_epoch = self.resolve_checkpoint(loc)
+
         logging.info('Retrieving pre-trained weights from {}'.format(load_location))
         self.load_weights(load_location)
 
         return last_epoch
 
+    def export_saved_model(self, export_dir, vocab_file):
+        # Only the variables are attached, since serializing the Keras model itself would trace `call`
+        self.layer.bert_model.relax_input_specs()
+
+        module = tf.Module()
+        module.model_weights = list(self.weights)
+        module.vocab = tf.saved_model.Asset(vocab_file)
+
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, None), dtype=tf.int32, name='input_ids'),
+                                      tf.TensorSpec(shape=(None, 2), dtype=tf.float32, name='sentiment')])
+        def serve(input_ids, sentiment):
+            return {'probabilities': self.preds_on_batch((input_ids, sentiment))}
+
+        module.serve = serve
+        tf.saved_model.save(module, export_dir, signatures={'serving_default': serve})
+
+        with open(os.path.join(export_dir, 'claimspotter.json'), 'w') as f:
+            json.dump({'checkpoint': self.checkpoint_identity(), 'tfm_type': FLAGS.cs_tfm_type,
+                       'model_size': FLAGS.cs_model_size, 'max_len': FLAGS.cs_max_len}, f)
+
+        logging.info('Exported serving SavedModel to {}'.format(export_dir))
+
     def save_custom_model(self, epoch, fold, metrics_obj):
         loc = os.path.join(FLAGS.cs_model_dir, 'fold_{}_{}'.format(str(fold + 1).zfill(2), str(epoch + 1).zfill(3)))
         self.save_weights(os.path.join(loc, FLAGS.cs_model_ckpt))
@@ -82,6 +120,95 @@ class ClaimSpotterModel(tf.keras.models.Model):
         return self.layer.preds_on_batch(x)
 
 
+# Times a ClaimSpotterPredictor traced its inference function in this process, by padded sequence length
+trace_counts = Counter()
+
+
+class ClaimSpotterPredictor:
+    """
+    Inference-only view of a ClaimSpotterModel. Traces one function per padded sequence length, each with a
+    dynamic batch dimension, so partial batches and new batch sizes never trigger a retrace. Every trace is counted
+    in `trace_counts`.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.model.layer.bert_model.relax_input_specs()
+        self.traced_fns = {}
+
+    def preds_on_batch(self, x):
+        seq_len = int(x[0].shape[1])
+
+        if seq_len not in self.traced_fns:
+            self.traced_fns[seq_len] = tf.function(self._traced_preds_on_batch, input_signature=[(
+                tf.TensorSpec(shape=(None, seq_len), dtype=tf.int32),
+                tf.TensorSpec(shape=(None, 2), dtype=tf.float32))])
+
+        return self.traced_fns[seq_len](x)
+
+    def _traced_preds_on_batch(self, x):
+        # Python side effects only run while tracing
+        trace_counts[int(x[0].shape[1])] += 1
+        return self.model.preds_on_batch(x)
+
+
+class SavedModelPredictor:
+    """
+    Serves the `serving_default` signature of a SavedModel written by `ClaimSpotterModel.export_saved_model`.
+    Loading it needs neither the transformer code nor the pre-trained BERT weights.
+    """
+
+    def __init__(self, export_dir):
+        logging.info('Loading serving SavedModel from {}'.format(export_dir))
+        self.module = tf.saved_model.load(export_dir)
+        self.serve = self.module.signatures['serving_default']
+
+    def preds_on_batch(self, x):
+        return self.serve(input_ids=tf.convert_to_tensor(x[0], dtype=tf.int32),
+                          sentiment=tf.convert_to_tensor(x[1], dtype=tf.float32))['probabilities']
+
+    @staticmethod
+    def config(export_dir):
+        with open(os.path.join(export_dir, 'claimspotter.json')) as f:
+            return json.load(f)
+
+    @staticmethod
+    def identity(export_dir):
+        return SavedModelPredictor.config(export_dir)['checkpoint']
+
+
+class QuantizedPredictor:
+    """
+    Serves an int8 TFLite conversion of an exported SavedModel. Dense kernels are stored as int8 with per-channel
+    scales and the fully connected layers run int8 matmuls, with activations quantized dynamically per batch.
+    """
+
+    model_file = 'claimspotter_int8.tflite'
+
+    def __init__(self, export_dir, num_threads=None):
+        model_loc = os.path.join(export_dir, self.model_file)
+        logging.info('Loading int8 model from {}'.format(model_loc))
+        self.interpreter = tf.lite.Interpreter(model_path=model_loc, num_threads=num_threads)
+        self.runner = self.interpreter.get_signature_runner('serving_default')
+
+    def preds_on_batch(self, x):
+        return self.runner(input_ids=np.asarray(x[0], dtype=np.int32),
+                           sentiment=np.asarray(x[1], dtype=np.float32))['probabilities']
+
+    @staticmethod
+    def convert(export_dir):
+        converter = tf.lite.TFLiteConverter.from_saved_model(export_dir)
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        model_loc = os.path.join(export_dir, QuantizedPredictor.model_file)
+        with open(model_loc, 'wb') as f:
+            f.write(converter.convert())
+        return model_loc
+
+    @staticmethod
+    def identity(export_dir):
+        return SavedModelPredictor.identity(export_dir) + ':int8'
+
+
 class ClaimSpotterLayer(tf.keras.layers.Layer):
     def __init__(self, cls_weights=None):
         super(ClaimSpotterLayer, self).__init__()
@@ -0,0 +1,124 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import os
+from absl import logging
+from bert_adversarial.core.utils.flags import FLAGS
+
+_tf_threads = None
+
+
+def available_cores():
+    """
+    Returns the cores this process may run on. Unlike os.cpu_count(), this respects taskset and container cpusets.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def parse_cores(spec):
+    # ['0-3', '8'] -> [0, 1, 2, 3, 8]
+    ret = []
+    for x in spec:
+        lo, _, hi = str(x).partition('-')
+        ret += list(range(int(lo), int(hi or lo) + 1))
+    return sorted(set(ret))
+
+
+def configured_cores():
+    cores = parse_cores(FLAGS.cs_cpu_cores) if FLAGS.cs_cpu_cores else available_cores()
+    return [x for x in cores if x in available_cores()] or available_cores()
+
+
+def worker_cores(index, num_workers):
+    """
+    Splits cs_cpu_cores into `num_workers` contiguous slices and returns the slice of worker `index`. Workers share
+    cores round-robin when there are more workers than cores.
+    """
+    cores = configured_cores()
+    if num_workers >= len(cores):
+        return [cores[index % len(cores)]]
+    size = len(cores) // num_workers
+    return cores[index * size:(index + 1) * size if index < num_workers - 1 else len(cores)]
+
+
+def pin_cores(cores):
+    if not hasattr(os, 'sched_setaffinity'):
+        logging.warning('CPU pinning is not supported on this platform')
+        return
+    os.sched_setaffinity(0, cores)
+    logging.info('Pinned process {} to cores {}'.format(os.getpid(), cores))
+
+
+def set_cpu_env(num_threads):
+    """
+    Sets the OpenMP and oneDNN environment. TF reads it when it is loaded, so entry points call this before anything
+    imports tensorflow. Values already in the environment are kept, except that cs_cpu_onednn overrides oneDNN.
+    """
+    os.environ.setdefault('OMP_NUM_THREADS', str(FLAGS.cs_cpu_omp_threads or num_threads))
+    if FLAGS.cs_cpu_pin:
+        # Only used by Intel OpenMP builds: keep threads on their cores and stop spinning soon after each op
+        os.environ.setdefault('KMP_AFFINITY', 'granularity=fine,compact,1,0')
+        os.environ.setdefault('KMP_BLOCKTIME', '1')
+    if FLAGS.cs_cpu_onednn != 'default':
+        os.environ['TF_ENABLE_ONEDNN_OPTS'] = '1' if FLAGS.cs_cpu_onednn == 'on' else '0'
+
+
+def set_tf_threads(intra_op_threads):
+    """
+    Sizes the TF thread pools of this process. TF only accepts this before its runtime is initialized, so the first
+    caller in a process wins. Returns the intra-op thread count in effect.
+    """
+    global _tf_threads
+    if _tf_threads is not None:
+        return _tf_threads
+
+    import tensorflow as tf
+
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if FLAGS.cs_inter_op_threads > 0:
+        tf.config.threading.set_inter_op_parallelism_threads(FLAGS.cs_inter_op_threads)
+    _tf_threads = intra_op_threads
+    logging.info('TF threads: {} intra-op, {} inter-op'.format(intra_op_threads, FLAGS.cs_inter_op_threads or
+                                                               'default'))
+    return _tf_threads
+
+
+def configured_tf_threads():
+    return _tf_threads
+
+
+def training_intra_op_threads():
+    return FLAGS.cs_intra_op_threads or len(configured_cores())
+
+
+def configure_cpu(intra_op_threads=None):
+    """
+    Applies the CPU execution flags to this process: pins it to cs_cpu_cores with --cs_cpu_pin, and sizes the TF
+    thread pools, by default to cs_intra_op_threads or one thread per configured core. Used by training and
+    evaluation, which set the matching environment with set_cpu_env before importing TF; the server sizes its pools
+    per model process.
+    """
+    if FLAGS.cs_cpu_pin:
+        pin_cores(configured_cores())
+    return set_tf_threads(intra_op_threads or training_intra_op_threads())
@@ -226,6 +226,7 @@ class DataLoader:
         return dl
 
     @staticmethod
-    def pad_seq(inp, ver=0):  # 0 is int, 1 is string
-        return pad_sequences(inp, padding="post", maxlen=FLAGS.cs_max_len) if ver == 0 else \
-            pad_sequences(inp, padding="post", maxlen=FLAGS.cs_max_len, dtype='str', value='')
+    def pad_seq(inp, ver=0, maxlen=None):  # 0 is int, 1 is string
+        maxlen = maxlen or FLAGS.cs_max_len
+        return pad_sequences(inp, padding="post", maxlen=maxlen) if ver == 0 else \
+            pad_sequences(inp, padding="post", maxlen=maxlen, dtype='str', value='')
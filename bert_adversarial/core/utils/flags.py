@@ -21,6 +21,7 @@
 #
 
 from absl import app, flags, logging
+import json
 import sys
 
 FLAGS = flags.FLAGS
@@ -34,9 +35,23 @@ FLAGS = flags.FLAGS
 
 # Hardware
 flags.DEFINE_list('cs_gpu', [0], 'ID of GPU to use: in range [0, 4]')
+flags.DEFINE_list('cs_cpu_cores', [], 'CPU cores (ids or ranges like 0-7) the process and its workers run on (empty uses every core available to it)')
+flags.DEFINE_bool('cs_cpu_pin', False, 'Pin the process to cs_cpu_cores, and each inference worker process to its own slice of them')
+flags.DEFINE_integer('cs_intra_op_threads', 0, 'TF intra-op threads when training and evaluating (0 uses every core in cs_cpu_cores)')
+flags.DEFINE_integer('cs_inter_op_threads', 0, 'TF inter-op threads per process (0 leaves the TF default)')
+flags.DEFINE_integer('cs_cpu_omp_threads', 0, 'OMP_NUM_THREADS for each process, unless set in the environment (0 matches its TF intra-op threads)')
+flags.DEFINE_string('cs_cpu_onednn', 'default', 'Force TF oneDNN optimizations `on` or `off`, or leave the TF `default`')
+flags.DEFINE_string('cs_cpu_profile', None, 'CPU profile written by autotune.py; its settings apply unless given on the command line')
+flags.DEFINE_string('cs_autotune_out', './cpu_profile.json', 'Where autotune.py writes the fastest CPU profile')
+flags.DEFINE_bool('cs_autotune_trial', False, 'Internal: run one autotune.py measurement with the given flags and print its throughput')
+flags.DEFINE_integer('cs_autotune_sentences', 512, 'Sentences scored per configuration by autotune.py')
 
 # Preprocessing
 flags.DEFINE_bool('cs_ner_spacy', False, 'Named entity recognition with spaCy')
+flags.DEFINE_string('cs_nltk_data_dir', None, 'Local NLTK data directory searched first, and the prefetch target')
+flags.DEFINE_bool('cs_nltk_download', False, 'Download missing NLTK resources on first use instead of raising')
+flags.DEFINE_list('cs_timing_modules', ['bert_adversarial.core.api.api_wrapper'], 'Modules imported by the startup timing report')
+flags.DEFINE_integer('cs_timing_top', 25, 'Number of packages listed by the startup timing report')
 
 # Base directories
 flags.DEFINE_string('cs_model_dir', './output', 'Location of model (both input and output)')
@@ -109,6 +124,50 @@ flags.DEFINE_integer('cs_batch_size_adv', 12, 'Size of the batch when adversaria
 
 flags.DEFINE_bool('cs_temp_adj_flag', False, 'Temp flag')
 
+# Serving
+flags.DEFINE_integer('cs_serve_max_batch_size', 0, 'Max sentences coalesced into one inference batch (0 uses cs_batch_size_reg)')
+flags.DEFINE_float('cs_serve_max_wait_ms', 5.0, 'Max time (ms) a queued request waits for its batch to fill')
+flags.DEFINE_string('cs_serve_executor', 'thread', 'Run inference on a `thread` or `process` pool, or `prefork` HTTP workers around one model host')
+flags.DEFINE_integer('cs_serve_http_workers', 0, 'Number of forked HTTP workers in `prefork` mode (0 uses one per core)')
+flags.DEFINE_string('cs_serve_ipc', 'shm', 'How `prefork` HTTP workers send batches to the model host: through `shm` (shared memory) or pickled over a `pipe`')
+flags.DEFINE_integer('cs_serve_replicas', 1, 'Number of model replicas (threads or worker processes) serving inference')
+flags.DEFINE_integer('cs_serve_doc_workers', 0, 'Worker processes with their own models that score the shards of large documents in `thread` mode (0 scores them on the replicas)')
+flags.DEFINE_integer('cs_serve_doc_min_sentences', 256, 'Documents with at least this many sentences are scored on the cs_serve_doc_workers pool')
+flags.DEFINE_integer('cs_serve_token_budget', 4096, 'Approx. WordPiece tokens per inference batch when scoring documents')
+flags.DEFINE_integer('cs_serve_http_pool_size', 32, 'Max pooled connections used to fetch pages for /score/url')
+flags.DEFINE_float('cs_serve_http_timeout', 15.0, 'Timeout (s) for fetching a page for /score/url')
+flags.DEFINE_list('cs_serve_length_buckets', [], 'Pad inference batches only to the smallest of these lengths that fits, e.g. 32,64,128 (cs_max_len is always the last bucket)')
+flags.DEFINE_bool('cs_serve_prewarm', True, 'Score a dummy batch at every padded length (see cs_serve_length_buckets) when a replica is built, so no request triggers a trace')
+flags.DEFINE_integer('cs_serve_cache_size', 100000, 'Max predictions kept in the in-memory LRU cache (0 disables caching)')
+flags.DEFINE_string('cs_serve_cache_db', None, 'Optional sqlite file backing the prediction cache on disk')
+flags.DEFINE_integer('cs_serve_url_max_bytes', 2000000, 'Most bytes of a page /score/url downloads; the rest is ignored')
+flags.DEFINE_integer('cs_serve_url_max_sentences', 1000, 'Most content sentences of a page /score/url scores')
+flags.DEFINE_integer('cs_serve_url_min_block_words', 5, 'Shorter text blocks of a page (menu items, bylines, captions) are dropped as boilerplate')
+flags.DEFINE_string('cs_serve_page_cache_db', None, 'Optional sqlite file caching the pages /score/url fetched, their sentences and scores, revalidated with ETag/Last-Modified')
+flags.DEFINE_integer('cs_serve_page_cache_size', 10000, 'Max URLs kept in cs_serve_page_cache_db, least recently used first out')
+flags.DEFINE_string('cs_bench_pages_dir', './pages', 'Folder of saved .html pages that bench_extraction.py benchmarks /score/url extraction on')
+flags.DEFINE_string('cs_serve_saved_model', None, 'Serve from a SavedModel written by export.py instead of building the model from a checkpoint')
+flags.DEFINE_bool('cs_serve_quantized', False, 'Serve the int8 model written by quantize.py next to --cs_serve_saved_model')
+flags.DEFINE_integer('cs_quantize_eval_batches', 0, 'Limit the quantize.py parity report to this many dev batches. 0 uses all of them')
+flags.DEFINE_string('cs_export_dir', './export', 'Output location of the SavedModel serving artifact written by export.py')
+flags.DEFINE_integer('cs_serve_stream_max_buffer', 20000, 'Characters of unfinished sentence /score/stream holds before force-splitting it')
+flags.DEFINE_integer('cs_serve_max_queue', 2048, 'Most sentences admitted at once; requests beyond it are rejected with 429')
+flags.DEFINE_float('cs_serve_deadline_ms', 10000.0, 'Default per-request deadline, overridable with an X-Deadline-Ms header. 0 disables deadlines')
+flags.DEFINE_string('cs_serve_degraded', 'off', 'What to serve instead of rejecting when overloaded: off, cache or svm')
+flags.DEFINE_string('cs_serve_admin_token', None, 'Token required in the X-Admin-Token header of /admin requests. Admin endpoints are disabled when unset')
+flags.DEFINE_float('cs_serve_watch_interval', 0.0, 'Seconds between checks of cs_model_dir (or cs_serve_saved_model) for a new model to hot-swap in. 0 disables watching')
+flags.DEFINE_string('cs_serve_canary_file', None, 'Labeled .json sentences (same format as the training data) that a replacement model must score before it is swapped in')
+flags.DEFINE_float('cs_serve_canary_min_acc', 0.5, 'Minimum accuracy on cs_serve_canary_file for a replacement model to be swapped in')
+flags.DEFINE_string('cs_serve_cascade', None, 'Calibration file written by calibrate_cascade.py; screens sentences with the SVM first when set')
+flags.DEFINE_string('cs_svm_model_dir', './svm/models', 'Location of the models written by svm/svm-train.py')
+flags.DEFINE_string('cs_svm_model_name', 'kfold_25ncs.json', 'Training file name the SVM models were saved under')
+flags.DEFINE_float('cs_cascade_max_f1_loss', 0.005, 'Largest weighted F1 drop calibrate_cascade.py may trade for fewer transformer calls')
+flags.DEFINE_float('cs_cascade_max_ndcg_loss', 0.005, 'Largest nDCG drop calibrate_cascade.py may trade for fewer transformer calls')
+flags.DEFINE_string('cs_cascade_out', './cascade.json', 'Where calibrate_cascade.py writes the chosen thresholds')
+flags.DEFINE_list('cs_serve_models', [], 'Extra models served next to the default one as name=kind:path, picked per request with `model=name`. kind is `transformer` (export.py SavedModel), `svm` (<svm model dir>/<training file name>) or `bilstm` (.h5)')
+flags.DEFINE_integer('cs_serve_metrics_window', 4096, 'Most recent observations per metric used for the /metrics quantiles')
+flags.DEFINE_integer('cs_serve_intra_op_threads', 0, 'TF intra-op threads per model process, shared by its replicas (0 uses every core in cs_cpu_cores, split between the workers in process mode)')
+
 
 def clean_argv(inp):
 	ret = [inp[0]]
@@ -138,6 +197,11 @@ flags.DEFINE_string('cs_prc_data_loc', '{}/all_data.pickle'.format(FLAGS.cs_data
 flags.DEFINE_string('cs_prc_clef_loc', '{}/all_clef_data.pickle'.format(FLAGS.cs_data_dir), 'Location of saved processed CLEF data')
 
 FLAGS.cs_model_loc = FLAGS.cs_model_loc + '_' + FLAGS.cs_model_size
+if FLAGS.cs_cpu_profile:
+	with open(FLAGS.cs_cpu_profile) as f:
+		for k, v in json.load(f)['flags'].items():
+			if not FLAGS[k].present:
+				FLAGS[k].value = v
 if any(['large' in FLAGS.cs_model_size]):
 	FLAGS.cs_tfm_layers *= 2
 	FLAGS.cs_tfm_ft_enc_layers *= 2
@@ -147,6 +211,12 @@ if any(['large' in FLAGS.cs_model_size]):
 FLAGS.cs_prc_data_loc = FLAGS.cs_prc_data_loc[:-7] + '_{}'.format(FLAGS.cs_tfm_type) + '.pickle'
 
 assert FLAGS.cs_tfm_type in ['bert', 'albert']
+assert FLAGS.cs_serve_executor in ['thread', 'process', 'prefork']
+assert FLAGS.cs_serve_ipc in ['shm', 'pipe']
+assert FLAGS.cs_cpu_onednn in ['default', 'on', 'off']
+assert FLAGS.cs_serve_degraded in ['off', 'cache', 'svm']
+assert not FLAGS.cs_serve_quantized or FLAGS.cs_serve_saved_model, '--cs_serve_quantized requires --cs_serve_saved_model'
+assert not FLAGS.cs_serve_models or FLAGS.cs_serve_executor == 'thread', '--cs_serve_models requires the `thread` executor'
 assert FLAGS.cs_num_classes == 2, 'FLAGS.cs_num_classes must be 2: 3 class comparisons are deprecated.'
 assert FLAGS.cs_stat_print_interval % FLAGS.cs_model_save_interval == 0
 
@@ -0,0 +1,73 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import subprocess
+import sys
+from collections import defaultdict
+from bert_adversarial.core.utils.flags import FLAGS
+
+
+def measure_imports(module):
+    """
+    Imports `module` in a fresh interpreter under `-X importtime` and returns a list of
+    (module name, self time in us, cumulative time in us), one entry per imported module.
+    """
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    if proc.returncode != 0:
+        raise Exception('Importing {} failed:\n{}'.format(module, proc.stderr[-2000:]))
+
+    ret = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        ret.append((name.strip(), int(self_us), int(cumulative_us)))
+    return ret
+
+
+def report(module, top):
+    timings = measure_imports(module)
+    by_package = defaultdict(int)
+    for name, self_us, _ in timings:
+        by_package[name.split('.')[0]] += self_us
+
+    total = sum(by_package.values())
+    print('Startup import cost of {}: {:.3f}s over {} modules'.format(module, total / 1e6, len(timings)))
+    print('{:<32} {:>10} {:>7}'.format('Package', 'Self (s)', 'Share'))
+    for pkg, self_us in sorted(by_package.items(), key=lambda x: -x[1])[:top]:
+        print('{:<32} {:>10.3f} {:>6.1f}%'.format(pkg, self_us / 1e6, 100 * self_us / max(total, 1)))
+
+    print('{:<56} {:>10}'.format('Slowest project modules', 'Cumul (s)'))
+    own = sorted([x for x in timings if x[0].startswith('bert_adversarial')], key=lambda x: -x[2])[:top]
+    for name, _, cumulative_us in own:
+        print('{:<56} {:>10.3f}'.format(name, cumulative_us / 1e6))
+    print()
+
+
+def main():
+    for module in FLAGS.cs_timing_modules:
+        report(module, FLAGS.cs_timing_top)
+
+
+if __name__ == '__main__':
+    main()
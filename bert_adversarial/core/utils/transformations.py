@@ -20,25 +20,26 @@
 #     Arlington, TX 76019
 #
 
-import nltk
-import spacy
 import string
-from textblob import TextBlob
-from tensorflow.keras.preprocessing.text import text_to_word_sequence
 from tqdm import tqdm
 from bert_adversarial.core.utils.flags import FLAGS
 
-nltk.download('punkt')
-nltk.download('averaged_perceptron_tagger')
-nltk.download('tagsets')
-nltk.download('stopwords')
+# nltk, spaCy, TextBlob and Keras are imported on first use so that importing this module stays cheap and never
+# touches the network. Run `python3 -m bert_adversarial.core.utils.transformations` once to prefetch the NLTK data.
+# Newer NLTK releases renamed some packages, so each resource lists the (package, path) of every known name.
+nltk_resources = {
+    'punkt': [('punkt_tab', 'tokenizers/punkt_tab'), ('punkt', 'tokenizers/punkt')],
+    'averaged_perceptron_tagger': [('averaged_perceptron_tagger_eng', 'taggers/averaged_perceptron_tagger_eng'),
+                                   ('averaged_perceptron_tagger', 'taggers/averaged_perceptron_tagger')],
+    'tagsets': [('tagsets', 'help/tagsets')]
+}
 
 nlp = None
 cont = None
 embed_obj = None
 kill_words = ["", "uh"]
-stop_words = list(nltk.corpus.stopwords.words('english'))
-pos_labels = list(nltk.load("help/tagsets/upenn_tagset.pickle").keys())
+pos_labels = None
+checked_resources = set()
 
 spacy_to_nl = {
     "PERSON": "person",
@@ -325,6 +326,8 @@ def transform_sentence_complete(sentence):
     if not FLAGS.cs_custom_preprc:
         return sentence
 
+    from tensorflow.keras.preprocessing.text import text_to_word_sequence
+
     sentence = (process_sentence_ner_spacy(sentence) if FLAGS.cs_ner_spacy else sentence)
     sentence = ' '.join(text_to_word_sequence(sentence))
 
@@ -348,6 +351,8 @@ def process_dataset(inp_data):
 
 
 def get_sentiment(inp_data):
+    from textblob import TextBlob
+
     blob = TextBlob(inp_data)
     return [blob.polarity, blob.subjectivity]
 
@@ -374,17 +379,31 @@ def char_list_to_string(lst):
 
 
 def get_tags(sentence):
+    nltk = require_nltk('punkt', 'averaged_perceptron_tagger')
     text = nltk.tokenize.word_tokenize(sentence)
     res = nltk.pos_tag(text)
     return res
 
 
+def get_pos_labels():
+    global pos_labels
+
+    if pos_labels is None:
+        pos_labels = list(require_nltk('tagsets').load("help/tagsets/upenn_tagset.pickle").keys())
+    return pos_labels
+
+
+def sentence_tokenize(text):
+    return require_nltk('punkt').sent_tokenize(text)
+
+
 def process_sentence_full_tags(sentence):
     prc_res = get_tags(sentence)
+    labels = get_pos_labels()
     ret = []
     for f in prc_res:
         try:
-            ret.append(pos_labels.index(f[1]))
+            ret.append(labels.index(f[1]))
         except Exception as e:
             print(f[0], f[1])
     return ret
@@ -403,10 +422,63 @@ def process_sentence_ner_spacy(sentence):
     return char_list_to_string(ret)
 
 
+def require_nltk(*resources):
+    """
+    Returns the nltk module after checking that `resources` are available locally. Nothing is downloaded unless
+    `cs_nltk_download` is set; otherwise a missing resource raises with instructions to prefetch it.
+    """
+    import nltk
+
+    if FLAGS.cs_nltk_data_dir and FLAGS.cs_nltk_data_dir not in nltk.data.path:
+        nltk.data.path.insert(0, FLAGS.cs_nltk_data_dir)
+
+    for res in resources:
+        if res in checked_resources:
+            continue
+        if not nltk_resource_found(nltk, res):
+            if not FLAGS.cs_nltk_download:
+                raise LookupError('NLTK resource `{}` not found. Run `python3 -m bert_adversarial.core.utils.'
+                                  'transformations` to prefetch it, or pass --cs_nltk_download'.format(res))
+            download_nltk_resource(nltk, res)
+        checked_resources.add(res)
+
+    return nltk
+
+
+def nltk_resource_found(nltk, res):
+    for _, path in nltk_resources[res]:
+        try:
+            nltk.data.find(path)
+            return True
+        except LookupError:
+            pass
+    return False
+
+
+def download_nltk_resource(nltk, res):
+    results = [nltk.download(pkg, download_dir=FLAGS.cs_nltk_data_dir, quiet=True) for pkg, _ in nltk_resources[res]]
+    if not any(results):
+        raise Exception('Failed to fetch NLTK resource {}'.format(res))
+
+
+def prefetch_dependencies():
+    nltk = require_nltk()
+
+    print("Fetching NLTK Dependencies...")
+    for res in nltk_resources:
+        download_nltk_resource(nltk, res)
+    print("NLTK dependencies Fetched.")
+
+
 def load_dependencies():
     global nlp, cont, embed_obj
 
-    if FLAGS.cs_ner_spacy:
+    # Pays for the TextBlob import up front instead of on the first scored sentence
+    get_sentiment('')
+
+    if FLAGS.cs_ner_spacy and nlp is None:
+        import spacy
+
         print("Loading Spacy NER Tagger...")
         nlp = spacy.load("en_core_web_lg")
         print("Tagger loaded.")
@@ -414,20 +486,6 @@ def load_dependencies():
     print("Dependencies Loaded.")
 
 
-def load_deps_dummy():
-    global nlp
-
-    print("Loading NLTK Dependencies...")
-    nltk.download('punkt')
-    nltk.download('averaged_perceptron_tagger')
-    nltk.download('tagsets')
-    nltk.download('stopwords')
-    # print("Loading Spacy NER Tagger...")
-    # nlp = spacy.load("en_core_web_lg")
-    # print("Tagger loaded.")
-    print("NLTK dependencies Loaded.")
-
-
 if __name__ == '__main__':
-    load_deps_dummy()
+    prefetch_dependencies()
     print(get_tags('I like %^*%(^(*%^#(^#^^#$#^#$^#^ $^4 7*$6 89$*(^ #*($^  $ $$$$$$$ $1343025823 million dollars'))
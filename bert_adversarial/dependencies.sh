@@ -27,6 +27,8 @@
 # cd data/word2vec
 # ./get_w2v.sh
 
+(cd .. && python3 -m bert_adversarial.core.utils.transformations)
+
 cd ../data/
 ./get_bert.sh
 
@@ -21,10 +21,15 @@
 #
 
 import math
+from bert_adversarial.core.utils.cpu import configure_cpu, set_cpu_env, training_intra_op_threads
+from bert_adversarial.core.utils.flags import FLAGS
+
+# OpenMP and oneDNN read their environment when TensorFlow is loaded, which the imports below do
+set_cpu_env(training_intra_op_threads())
+
 from tqdm import tqdm
 import os
 from bert_adversarial.core.utils.data_loader import DataLoader
-from bert_adversarial.core.utils.flags import FLAGS
 from absl import logging
 import tensorflow as tf
 import numpy as np
@@ -38,6 +43,7 @@ K = tf.keras
 def main():
     os.environ['CUDA_VISIBLE_DEVICES'] = ','.join([str(z) for z in FLAGS.cs_gpu])
     os.environ['TF_FORCE_GPU_ALLOW_GROWTH'] = 'true'
+    configure_cpu()
 
     if not os.path.isdir(FLAGS.cs_model_dir):
         raise Exception('Cannot restore from non-existent folder: {}'.format(FLAGS.cs_model_dir))
@@ -0,0 +1,49 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import os
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+from bert_adversarial.core.models.model import ClaimSpotterModel
+
+
+def main():
+    if not os.path.isdir(FLAGS.cs_model_dir):
+        raise Exception('Cannot restore from non-existent folder: {}'.format(FLAGS.cs_model_dir))
+
+    logging.info("Warming up...")
+
+    model = ClaimSpotterModel()
+    model.warm_up()
+
+    logging.info('Attempting to restore weights from {}'.format(FLAGS.cs_model_dir))
+    model.load_custom_model()
+    logging.info('Restore successful')
+
+    # ALBERT tokenizes with SentencePiece, so its model file stands in for the WordPiece vocabulary
+    vocab_file = 'vocab.txt' if FLAGS.cs_tfm_type == 'bert' else '30k-clean.model'
+    model.export_saved_model(FLAGS.cs_export_dir, os.path.join(FLAGS.cs_model_loc, vocab_file))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
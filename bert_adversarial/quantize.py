@@ -0,0 +1,93 @@
+# Copyright (C) 2020 IDIR Lab - UT Arlington
+#
+#     This program is free software: you can redistribute it and/or modify
+#     it under the terms of the GNU General Public License v3 as published by
+#     the Free Software Foundation.
+#
+#     This program is distributed in the hope that it will be useful,
+#     but WITHOUT ANY WARRANTY; without even the implied warranty of
+#     MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+#     GNU General Public License for more details.
+#
+#     You should have received a copy of the GNU General Public License
+#     along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# Contact Information:
+#     See: https://idir.uta.edu/cli.html
+#
+#     Chengkai Li
+#     Box 19015
+#     Arlington, TX 76019
+#
+
+import os
+import time
+from tqdm import tqdm
+from bert_adversarial.core.utils.data_loader import DataLoader
+from bert_adversarial.core.utils.flags import FLAGS
+from absl import logging
+import numpy as np
+from sklearn.metrics import f1_score
+from bert_adversarial.core.utils.compute_ndcg import compute_ndcg
+from bert_adversarial.core.models.model import SavedModelPredictor, QuantizedPredictor
+from bert_adversarial.core.api.executor import process_intra_op_threads
+
+
+def dir_size(loc):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(loc) for f in files)
+
+
+def evaluate(predictor, batches):
+    all_pred = []
+    start = time.time()
+    for x_id, x_sent in tqdm(batches):
+        all_pred = all_pred + list(np.asarray(predictor.preds_on_batch((x_id, x_sent))))
+    return np.array(all_pred), time.time() - start
+
+
+def main():
+    if not os.path.isfile(os.path.join(FLAGS.cs_export_dir, 'saved_model.pb')):
+        raise Exception('No SavedModel at {}, run export.py first'.format(FLAGS.cs_export_dir))
+
+    logging.info('Converting {} to int8'.format(FLAGS.cs_export_dir))
+    model_loc = QuantizedPredictor.convert(FLAGS.cs_export_dir)
+    logging.info('Wrote {}'.format(model_loc))
+
+    logging.info("Loading dataset")
+    test_data = DataLoader().load_testing_data()
+    batches = [(np.array([x[0] for x in test_data.x[i:i + FLAGS.cs_batch_size_reg]], dtype=np.int32),
+                np.array([x[1] for x in test_data.x[i:i + FLAGS.cs_batch_size_reg]], dtype=np.float32))
+               for i in range(0, test_data.get_length(), FLAGS.cs_batch_size_reg)]
+    if FLAGS.cs_quantize_eval_batches > 0:
+        batches = batches[:FLAGS.cs_quantize_eval_batches]
+    all_y = test_data.y[:sum(len(x[0]) for x in batches)]
+
+    fp32_model = SavedModelPredictor(FLAGS.cs_export_dir)
+    int8_model = QuantizedPredictor(FLAGS.cs_export_dir, num_threads=process_intra_op_threads('thread', 1))
+
+    # One untimed batch each so tracing and allocation do not count against throughput
+    fp32_model.preds_on_batch(batches[0])
+    int8_model.preds_on_batch(batches[0])
+
+    stats = {}
+    for name, predictor, size in [('fp32', fp32_model, dir_size(os.path.join(FLAGS.cs_export_dir, 'variables'))),
+                                  ('int8', int8_model, os.path.getsize(model_loc))]:
+        preds, elapsed = evaluate(predictor, batches)
+        stats[name] = (preds, elapsed, size)
+
+    fp32_preds, int8_preds = stats['fp32'][0], stats['int8'][0]
+    agreement = np.mean(np.argmax(fp32_preds, axis=1) == np.argmax(int8_preds, axis=1))
+    max_diff = np.abs(fp32_preds - int8_preds).max()
+
+    print('{:<6} {:>8} {:>8} {:>12} {:>10}'.format('Model', 'F1', 'nDCG', 'Sent/sec', 'Size (MB)'))
+    for name, (preds, elapsed, size) in stats.items():
+        print('{:<6} {:>8.4f} {:>8.4f} {:>12.1f} {:>10.1f}'.format(
+            name, f1_score(all_y, np.argmax(preds, axis=1), average='weighted'),
+            compute_ndcg(all_y, [x[FLAGS.cs_num_classes - 1] for x in preds]), len(all_y) / elapsed, size / 2 ** 20))
+    print('Label agreement: {:.2f}% | Max abs prob diff: {:.5f} | Speedup: {:.2f}x'.format(
+        agreement * 100, max_diff, stats['fp32'][1] / stats['int8'][1]))
+
+
+if __name__ == '__main__':
+    logging.set_verbosity(logging.INFO)
+    main()
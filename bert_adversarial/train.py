@@ -23,10 +23,15 @@
 import math
 import time
 import os
+from bert_adversarial.core.utils.cpu import configure_cpu, set_cpu_env, training_intra_op_threads
+from bert_adversarial.core.utils.flags import FLAGS, print_flags
+
+# OpenMP and oneDNN read their environment when TensorFlow is loaded, which the imports below do
+set_cpu_env(training_intra_op_threads())
+
 from tqdm import tqdm
 from shutil import rmtree
 from bert_adversarial.core.utils.data_loader import DataLoader
-from bert_adversarial.core.utils.flags import FLAGS, print_flags
 from absl import logging
 import tensorflow as tf
 import numpy as np
@@ -164,6 +169,7 @@ def eval_model(test_x, test_y, test_len, model_loc):
 def main():
     os.environ['CUDA_VISIBLE_DEVICES'] = ','.join([str(z) for z in FLAGS.cs_gpu])
     os.environ['TF_FORCE_GPU_ALLOW_GROWTH'] = 'true'
+    configure_cpu()
 
     print_flags()
 
@@ -205,4 +205,8 @@ print(ndcg)
 # Training model on full dataset and saving
 full_model = create_model(max_words, embedding_dim, max_len, embedding_matrix)
 history = full_model.fit(X_train, Y_train, epochs=14)
-full_model.save(os.path.join("./saved_models/", 'Full_BiLSTM.h5'))
\ No newline at end of file
+full_model.save(os.path.join("./saved_models/", 'Full_BiLSTM.h5'))
+
+# The fitted tokenizer is needed to serve the model (see --cs_serve_models in bert_adversarial)
+with open(os.path.join("./saved_models/", 'Full_BiLSTM_tokenizer.json'), 'w') as f:
+    f.write(tokenizer.to_json())